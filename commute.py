@@ -0,0 +1,253 @@
+"""
+Offline commute times between postcode districts (the outward code, e.g. "N8" of "N8 7QB").
+
+The matrix is built once from a GTFS timetable extract (e.g. TfL's, or the DfT's Bus Open
+Data) and a CSV of postcode district centroids (district,lat,lon, e.g. averaged from the ONS
+Postcode Directory), neither of which is bundled:
+
+    python commute.py --gtfs path/to/gtfs --districts path/to/district_centroids.csv
+
+It is stored in data/commute as a uint16 minutes matrix plus a sorted district index, both
+memory-mapped at runtime, so looking up the commute of a batch of properties is a binary
+search and a gather with no network.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from geo import DATA_DIR, GeoIndex, haversine_km
+
+
+COMMUTE_DIR = os.path.join(DATA_DIR, "commute")
+UNREACHABLE = np.iinfo(np.uint16).max
+WALK_KM_PER_HOUR = 4.8
+# Streets are rarely straight, stretch crow-flies distances by this factor when walking
+WALK_DETOUR = 1.3
+# Travel within a single district, which its centroid can't capture
+INTRA_DISTRICT_MINUTES = 15
+_POSTCODE_PATTERN = re.compile(r"^([A-Z]{1,2}[0-9][0-9A-Z]?)\s*([0-9][A-Z]{2})?$")
+
+
+def postcode_district(postcode: Optional[str]) -> Optional[str]:
+    """Outward code of a full or partial postcode, e.g. "sw1a1aa" -> "SW1A", or None."""
+    if not postcode:
+        return None
+    match = _POSTCODE_PATTERN.match(" ".join(str(postcode).upper().split()))
+    return match.group(1) if match else None
+
+
+def _walk_seconds(distance_km):
+    return np.asarray(distance_km) * WALK_DETOUR / WALK_KM_PER_HOUR * 3600
+
+
+def _gtfs_seconds(value: str) -> int:
+    # GTFS times can pass 24:00:00 for trips running after midnight
+    hours, minutes, seconds = value.split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+def _read_csv(path: str):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        yield from csv.DictReader(f)
+
+
+def build_commute_matrix(
+    gtfs_dir: str,
+    districts_csv: str,
+    out_dir: str = COMMUTE_DIR,
+    window: Tuple[int, int] = (7 * 3600, 10 * 3600),
+    access_km: float = 1.0,
+    transfer_km: float = 0.4,
+    max_minutes: int = 180,
+) -> np.ndarray:
+    """
+    Door-to-door morning peak travel times between district centroids, in minutes.
+
+    The graph has a node per stop, per (route, stop) pair and per district:
+      - rides between consecutive (route, stop) nodes take the fastest scheduled time in `window`
+      - boarding a route at a stop costs half its headway in `window`, alighting is free
+      - stops within transfer_km, and districts and stops within access_km, are linked by walking
+    Dijkstra then runs from every district at once. Walking straight there is used when it's
+    faster, and unreachable pairs (or longer than max_minutes) are stored as UNREACHABLE.
+
+    Expects stop_times.txt grouped by trip, as GTFS producers write it.
+    """
+    stops = list(_read_csv(os.path.join(gtfs_dir, "stops.txt")))
+    stop_ids = {row["stop_id"]: i for i, row in enumerate(stops)}
+    stop_lat = np.array([float(row["stop_lat"]) for row in stops])
+    stop_lon = np.array([float(row["stop_lon"]) for row in stops])
+    route_of_trip = {row["trip_id"]: row["route_id"] for row in _read_csv(os.path.join(gtfs_dir, "trips.txt"))}
+
+    # Sorted, so lookups can binary search the codes
+    districts = sorted(_read_csv(districts_csv), key=lambda row: row["district"].strip().upper())
+    district_codes = np.array([row["district"].strip().upper() for row in districts], dtype=np.str_)
+    district_lat = np.array([float(row["lat"]) for row in districts])
+    district_lon = np.array([float(row["lon"]) for row in districts])
+
+    edges: Dict[Tuple[int, int], float] = {}
+
+    def add_edge(u: int, v: int, seconds: float):
+        # Zero weights would be dropped by the sparse matrix, keep at least a second
+        seconds = max(float(seconds), 1.0)
+        if seconds < edges.get((u, v), np.inf):
+            edges[(u, v)] = seconds
+
+    route_stop_nodes: Dict[Tuple[str, int], int] = {}
+    departures: Dict[int, int] = {}
+
+    def route_stop(route_id: str, stop: int) -> int:
+        key = (route_id, stop)
+        if key not in route_stop_nodes:
+            route_stop_nodes[key] = len(stops) + len(route_stop_nodes)
+        return route_stop_nodes[key]
+
+    def add_trip(trip_id: str, calls: List[Tuple[int, int, int, int]]):
+        route_id = route_of_trip.get(trip_id, trip_id)
+        calls.sort()
+        for (_, stop_a, _, departs), (_, stop_b, arrives, _) in zip(calls, calls[1:]):
+            if not window[0] <= departs <= window[1]:
+                continue
+            node_a, node_b = route_stop(route_id, stop_a), route_stop(route_id, stop_b)
+            add_edge(node_a, node_b, arrives - departs)
+            departures[node_a] = departures.get(node_a, 0) + 1
+
+    trip_id, calls = None, []
+    for row in _read_csv(os.path.join(gtfs_dir, "stop_times.txt")):
+        if row["trip_id"] != trip_id:
+            if calls:
+                add_trip(trip_id, calls)
+            trip_id, calls = row["trip_id"], []
+        if row["stop_id"] in stop_ids and row["arrival_time"] and row["departure_time"]:
+            calls.append((int(row["stop_sequence"]), stop_ids[row["stop_id"]],
+                          _gtfs_seconds(row["arrival_time"]), _gtfs_seconds(row["departure_time"])))
+    if calls:
+        add_trip(trip_id, calls)
+
+    window_seconds = window[1] - window[0]
+    for (_, stop), node in route_stop_nodes.items():
+        # Half the average headway, capped at the window for routes calling once
+        add_edge(stop, node, window_seconds / departures.get(node, 1) / 2)
+        add_edge(node, stop, 0)
+
+    stop_index = GeoIndex.from_lat_lon(stop_lat, stop_lon)
+    for stop, nearby in enumerate(stop_index.within(stop_lat, stop_lon, transfer_km)):
+        walk = _walk_seconds(haversine_km(stop_lat[stop], stop_lon[stop], stop_lat[nearby], stop_lon[nearby]))
+        for other, seconds in zip(nearby.tolist(), walk.tolist()):
+            if other != stop:
+                add_edge(stop, other, seconds)
+
+    first_district = len(stops) + len(route_stop_nodes)
+    for d, nearby in enumerate(stop_index.within(district_lat, district_lon, access_km)):
+        walk = _walk_seconds(haversine_km(district_lat[d], district_lon[d], stop_lat[nearby], stop_lon[nearby]))
+        for stop, seconds in zip(nearby.tolist(), walk.tolist()):
+            add_edge(first_district + d, stop, seconds)
+            add_edge(stop, first_district + d, seconds)
+
+    n_nodes = first_district + len(districts)
+    pairs = np.array(list(edges.keys()), dtype=np.int64).reshape(-1, 2)
+    weights = np.fromiter(edges.values(), dtype=np.float64, count=len(edges))
+    graph = csr_matrix((weights, (pairs[:, 0], pairs[:, 1])), shape=(n_nodes, n_nodes))
+    district_nodes = np.arange(first_district, n_nodes)
+    seconds = dijkstra(graph, directed=True, indices=district_nodes, limit=max_minutes * 60)[:, district_nodes]
+
+    walking = _walk_seconds(haversine_km(district_lat[:, None], district_lon[:, None], district_lat[None], district_lon[None]))
+    minutes = np.minimum(seconds, walking) / 60
+    np.fill_diagonal(minutes, INTRA_DISTRICT_MINUTES)
+    matrix = np.where(minutes <= max_minutes, np.ceil(minutes), UNREACHABLE).astype(np.uint16)
+
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, "minutes.npy"), matrix)
+    np.save(os.path.join(out_dir, "districts.npy"), district_codes)
+    with open(os.path.join(out_dir, "meta.json"), "w") as f:
+        json.dump({
+            "gtfs": os.path.abspath(gtfs_dir),
+            "districts": os.path.abspath(districts_csv),
+            "window": list(window),
+            "stops": len(stops),
+            "route_stops": len(route_stop_nodes),
+            "edges": len(edges),
+        }, f, indent=2)
+    return matrix
+
+
+class CommuteMatrix:
+    """
+    District-to-district commute minutes, looked up for whole batches of postcodes with a
+    binary search over the sorted district codes.
+    """
+
+    def __init__(self, minutes: np.ndarray, districts: np.ndarray):
+        self.minutes = minutes
+        self.districts = districts
+
+    @classmethod
+    def load(cls, path: str = COMMUTE_DIR) -> "CommuteMatrix":
+        return cls(
+            np.load(os.path.join(path, "minutes.npy"), mmap_mode="r"),
+            np.load(os.path.join(path, "districts.npy")),
+        )
+
+    def rows(self, postcodes: Sequence[Optional[str]]) -> np.ndarray:
+        """Matrix row of each postcode's district, -1 where unknown."""
+        codes = np.array([postcode_district(p) or "" for p in postcodes], dtype=self.districts.dtype)
+        positions = np.searchsorted(self.districts, codes)
+        clipped = np.minimum(positions, len(self.districts) - 1)
+        return np.where(self.districts[clipped] == codes, clipped, -1)
+
+    def commute_minutes(self, origins: Sequence[Optional[str]], destination: str) -> np.ndarray:
+        """Minutes from each origin postcode to the destination, NaN if unknown or unreachable."""
+        origin_rows = self.rows(origins)
+        destination_row = self.rows([destination])[0]
+        result = np.full(len(origin_rows), np.nan)
+        if destination_row < 0:
+            return result
+        known = origin_rows >= 0
+        minutes = self.minutes[origin_rows[known], destination_row].astype(np.float64)
+        minutes[minutes == UNREACHABLE] = np.nan
+        result[known] = minutes
+        return result
+
+    def rank(self, origins: Sequence[Optional[str]], destination: str) -> np.ndarray:
+        """Positions of the origins from shortest to longest commute, unknown ones last."""
+        minutes = self.commute_minutes(origins, destination)
+        return np.argsort(np.where(np.isnan(minutes), np.inf, minutes), kind="stable")
+
+
+_matrix = None
+_matrix_lock = threading.Lock()
+
+
+def get_commute_matrix() -> Optional[CommuteMatrix]:
+    """Process-wide matrix from data/commute, or None if it hasn't been built."""
+    global _matrix
+    with _matrix_lock:
+        if _matrix is None:
+            try:
+                _matrix = CommuteMatrix.load()
+            except FileNotFoundError:
+                print(f"No commute matrix in {COMMUTE_DIR}, commute times are disabled")
+                _matrix = False
+        return _matrix or None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gtfs", required=True, help="directory with stops.txt, trips.txt and stop_times.txt")
+    parser.add_argument("--districts", required=True, help="CSV of district,lat,lon centroids")
+    parser.add_argument("--out", default=COMMUTE_DIR)
+    parser.add_argument("--window", default="07:00-10:00", help="departure window, HH:MM-HH:MM")
+    args = parser.parse_args()
+
+    start, end = (_gtfs_seconds(f"{t}:00") for t in args.window.split("-"))
+    matrix = build_commute_matrix(args.gtfs, args.districts, args.out, window=(start, end))
+    reachable = matrix != UNREACHABLE
+    print(f"{matrix.shape[0]} districts, {reachable.mean():.0%} of pairs reachable, "
+          f"median {np.median(matrix[reachable]):.0f} min, {matrix.nbytes / 1e6:.1f}MB")
@@ -1,17 +1,173 @@
+import asyncio
 import os
-from typing import List, Dict, Any, Optional
+import threading
+from typing import List, Dict, Any, AsyncIterator, Awaitable, Iterator, Optional, TypeVar
 
-from openai import AzureOpenAI
+import httpx
+from openai import AsyncAzureOpenAI
 from dotenv import load_dotenv
 
-from utils import retry
+from connection.cache import get_default_cache, make_cache_key
+from connection.rate_limiter import INTERACTIVE, RateLimiter, estimate_tokens
+from utils import CircuitBreaker, RetryPolicy
 
 
 # Load environment variables
 load_dotenv()
 
-class AzureClient:
-    def __init__(self, chat_completion_model="gpt-4.1"):
+T = TypeVar("T")
+
+
+class SharedTransport:
+    """
+    Process-wide pooled HTTP transport for Azure OpenAI.
+
+    One httpx.AsyncClient with keep-alive connections lives on a dedicated event loop thread,
+    so every AzureClient/AsyncAzureClient in the process (module-level agents, per-session
+    processors, batch jobs) reuses the same warm TLS connections. Sync callers block on
+    futures submitted to that loop; async callers on other loops await them.
+
+    Env vars:
+      - AZURE_OPENAI_MAX_CONNECTIONS (default 100)
+      - AZURE_OPENAI_MAX_KEEPALIVE_CONNECTIONS (default 20)
+      - AZURE_OPENAI_KEEPALIVE_EXPIRY seconds (default 30)
+      - AZURE_OPENAI_CONNECT_TIMEOUT / AZURE_OPENAI_READ_TIMEOUT seconds (default 5 / 60)
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.limits = httpx.Limits(
+            max_connections=int(os.getenv("AZURE_OPENAI_MAX_CONNECTIONS", 100)),
+            max_keepalive_connections=int(os.getenv("AZURE_OPENAI_MAX_KEEPALIVE_CONNECTIONS", 20)),
+            keepalive_expiry=float(os.getenv("AZURE_OPENAI_KEEPALIVE_EXPIRY", 30)),
+        )
+        self.timeout = httpx.Timeout(
+            float(os.getenv("AZURE_OPENAI_READ_TIMEOUT", 60)),
+            connect=float(os.getenv("AZURE_OPENAI_CONNECT_TIMEOUT", 5)),
+        )
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="azure-http-pool", daemon=True)
+        self._thread.start()
+        # The client has to be created on the loop that will drive its connections
+        self.http_client = self.run_sync(self._create_http_client())
+        self._openai_clients: Dict[tuple, AsyncAzureOpenAI] = {}
+
+    @classmethod
+    def get(cls) -> "SharedTransport":
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    async def _create_http_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+
+    def openai_client(self, endpoint: str, api_key: str, api_version: str) -> AsyncAzureOpenAI:
+        """Return the AsyncAzureOpenAI client for these credentials, built on the shared pool."""
+        key = (endpoint, api_key, api_version)
+        with self._lock:
+            if key not in self._openai_clients:
+                self._openai_clients[key] = AsyncAzureOpenAI(
+                    api_version=api_version,
+                    azure_endpoint=endpoint,
+                    api_key=api_key,
+                    http_client=self.http_client,
+                    # Retries are handled by our RetryPolicy so they are bounded by its deadline
+                    max_retries=0,
+                )
+            return self._openai_clients[key]
+
+    def run_sync(self, coro: Awaitable[T]) -> T:
+        """Run a coroutine on the pool's loop and block the calling thread until it finishes."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def run(self, coro: Awaitable[T]) -> T:
+        """Await a coroutine on the pool's loop from any other event loop."""
+        if asyncio.get_running_loop() is self.loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    def iterate_sync(self, agen: AsyncIterator[T], max_buffered: int = 64) -> Iterator[T]:
+        """
+        Drive an async generator on the pool's loop, yielding its items to a sync caller.
+
+        At most `max_buffered` items are read ahead of the caller. If the caller stops early
+        (closes the generator or drops it), the generator is closed on the loop, which lets it
+        release what it holds, e.g. the HTTP response of a stream.
+        """
+        items: asyncio.Queue = asyncio.Queue(maxsize=max_buffered)
+        done = object()
+
+        async def pump():
+            try:
+                try:
+                    async for item in agen:
+                        await items.put(item)
+                finally:
+                    await agen.aclose()
+            except Exception as e:
+                await items.put(e)
+            else:
+                await items.put(done)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                item = self.run_sync(items.get())
+                if item is done:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # No-op once the generator is exhausted, otherwise stops the pump and closes it
+            future.cancel()
+
+
+def _chat_kwargs(
+    messages: List[Dict[str, str]],
+    temperature: float,
+    max_tokens: Optional[int],
+    top_p: float,
+    frequency_penalty: float,
+    presence_penalty: float,
+    response_format,
+) -> Dict[str, Any]:
+    kwargs = dict(
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        top_p=top_p,
+        frequency_penalty=frequency_penalty,
+        presence_penalty=presence_penalty,
+    )
+    if response_format:
+        kwargs["response_format"] = response_format
+    return kwargs
+
+
+class AsyncAzureClient:
+    """
+    Async Azure OpenAI client on the shared transport.
+
+    Responses are cached (see connection.cache.get_default_cache) keyed by a hash of the
+    deployment, messages and parameters. Chat completions with temperature > 0 bypass the
+    cache unless cache_nondeterministic is set; embeddings are cached per text.
+
+    Requests go through the deployment's process-wide RateLimiter; `priority` decides who
+    goes first when it is saturated (connection.rate_limiter.INTERACTIVE or BACKGROUND).
+    """
+
+    def __init__(
+        self,
+        chat_completion_model="gpt-4.1",
+        use_cache: bool = True,
+        cache=None,
+        cache_nondeterministic: bool = False,
+        priority: int = INTERACTIVE,
+    ):
         self.endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
         self.api_key = os.getenv("AZURE_OPENAI_API_KEY")
         self.api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2024-12-01-preview")
@@ -19,22 +175,220 @@ class AzureClient:
         # Model deployments
         self.embedding_deployment = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "text-embedding-3-small")
         self.chat_deployment = chat_completion_model
-        
+
         if not all([self.endpoint, self.api_key]):
             raise ValueError("Missing required environment variables: AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_API_KEY")
-        
-        self.client = AzureOpenAI(
-            api_version=self.api_version,
-            azure_endpoint=self.endpoint,
-            api_key=self.api_key
+
+        self.transport = SharedTransport.get()
+        self.client = self.transport.openai_client(self.endpoint, self.api_key, self.api_version)
+        self.chat_retry_policy = self._retry_policy(self.chat_deployment)
+        self.embedding_retry_policy = self._retry_policy(self.embedding_deployment)
+        self.cache = (cache if cache is not None else get_default_cache()) if use_cache else None
+        self.cache_nondeterministic = cache_nondeterministic
+        self.priority = priority
+        self.chat_limiter = RateLimiter.for_deployment(f"{self.endpoint}/{self.chat_deployment}")
+        self.embedding_limiter = RateLimiter.for_deployment(f"{self.endpoint}/{self.embedding_deployment}")
+
+    def _retry_policy(self, deployment: str) -> RetryPolicy:
+        name = f"{self.endpoint}/{deployment}"
+        return RetryPolicy(
+            name=name,
+            tries=int(os.getenv("AZURE_OPENAI_RETRY_TRIES", 4)),
+            deadline=float(os.getenv("AZURE_OPENAI_RETRY_DEADLINE", 20)),
+            breaker=CircuitBreaker.for_endpoint(name),
         )
-        # self.client = AzureChatOpenAI(
-        #     api_version=self.api_version,
-        #     azure_endpoint=self.endpoint,
-        #     api_key=self.api_key
-        # )
 
-    @retry(ExceptionToCheck=Exception, tries=3, delay=30, backoff=2)
+    def chat_cache_key(self, kwargs: Dict[str, Any]) -> Optional[str]:
+        """Cache key for a chat completion, or None if it should not be cached."""
+        if self.cache is None or (kwargs["temperature"] > 0 and not self.cache_nondeterministic):
+            return None
+        return make_cache_key("chat", {"deployment": self.chat_deployment, **kwargs})
+
+    def cache_chat_completion(self, key: Optional[str], result: Dict[str, Any]):
+        if key is not None and result.get("finish_reason") == "stop":
+            self.cache.set(key, result)
+
+    def cached_chat_completion(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        if key is None:
+            return None
+        result = self.cache.get(key)
+        return {**result, "cached": True} if result is not None else None
+
+    def _embedding_cache_key(self, text: str) -> str:
+        return make_cache_key("embedding", {"deployment": self.embedding_deployment, "text": text})
+
+    async def _embeddings(self, texts: List[str]) -> List[list[float]]:
+        results: List[Optional[list[float]]] = [None] * len(texts)
+        if self.cache is not None:
+            for i, text in enumerate(texts):
+                results[i] = self.cache.get(self._embedding_cache_key(text))
+        # Only send the misses, each distinct text once
+        misses = list(dict.fromkeys(text for text, result in zip(texts, results) if result is None))
+        if misses:
+            reserved = estimate_tokens(misses, max_tokens=0)
+
+            async def create():
+                await self.embedding_limiter.acquire(reserved, self.priority)
+                try:
+                    return await self.client.embeddings.create(input=misses, model=self.embedding_deployment)
+                except BaseException:
+                    # A failed attempt gives its reservation back, so retries don't drain the bucket
+                    self.embedding_limiter.reconcile(reserved, 0)
+                    raise
+
+            response = await self.embedding_retry_policy.acall(create)
+            self.embedding_limiter.reconcile(reserved, response.usage.total_tokens)
+            fetched = dict(zip(misses, (item.embedding for item in response.data)))
+            for i, text in enumerate(texts):
+                if results[i] is None:
+                    results[i] = fetched[text]
+            if self.cache is not None:
+                for text, embedding in fetched.items():
+                    self.cache.set(self._embedding_cache_key(text), embedding)
+        return results
+
+    async def _chat_completion(self, **kwargs) -> Dict[str, Any]:
+        key = self.chat_cache_key(kwargs)
+        cached = self.cached_chat_completion(key)
+        if cached is not None:
+            return cached
+
+        reserved = self._chat_reservation(kwargs)
+        response = await self.chat_retry_policy.acall(self._create_chat_completion, reserved, **kwargs)
+        self.chat_limiter.reconcile(reserved, response.usage.total_tokens)
+        result = {
+            "content": response.choices[0].message.content,
+            "role": response.choices[0].message.role,
+            "finish_reason": response.choices[0].finish_reason,
+            "usage": {
+                "prompt_tokens": response.usage.prompt_tokens,
+                "completion_tokens": response.usage.completion_tokens,
+                "total_tokens": response.usage.total_tokens
+            }
+        }
+        self.cache_chat_completion(key, result)
+        return result
+
+    def _chat_reservation(self, kwargs: Dict[str, Any]) -> int:
+        return estimate_tokens((msg["content"] for msg in kwargs["messages"]), kwargs["max_tokens"])
+
+    async def _create_chat_completion(self, reserved: int, **kwargs):
+        await self.chat_limiter.acquire(reserved, self.priority)
+        try:
+            return await self.client.chat.completions.create(model=self.chat_deployment, **kwargs)
+        except BaseException:
+            # A failed attempt gives its reservation back, so retries don't drain the bucket
+            self.chat_limiter.reconcile(reserved, 0)
+            raise
+
+    async def _open_stream(self, **kwargs):
+        # Only opening the stream is retried; once tokens are flowing to the UI we can't replay them
+        reserved = self._chat_reservation(kwargs)
+        stream = await self.chat_retry_policy.acall(
+            self._create_chat_completion, reserved, stream=True, stream_options={"include_usage": True}, **kwargs
+        )
+        prompt_tokens = estimate_tokens((msg["content"] for msg in kwargs["messages"]), max_tokens=0)
+        return stream, reserved, prompt_tokens
+
+    async def _stream(self, stream, reserved: int, final: Optional[Dict[str, Any]] = None,
+                      prompt_tokens: int = 0) -> AsyncIterator[str]:
+        """
+        Yield the content deltas, filling `final` with the finish_reason and usage once they arrive.
+        If the stream ends without usage (it failed, or the reader stopped early), the reservation
+        is reconciled with an estimate from the prompt and the content streamed so far.
+        """
+        final = final if final is not None else {}
+        streamed = []
+        try:
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    # With include_usage the last chunk carries the token counts
+                    self.chat_limiter.reconcile(reserved, chunk.usage.total_tokens)
+                    final["usage"] = {
+                        "prompt_tokens": chunk.usage.prompt_tokens,
+                        "completion_tokens": chunk.usage.completion_tokens,
+                        "total_tokens": chunk.usage.total_tokens,
+                    }
+                # Azure sends an initial chunk with prompt filter results and no choices
+                if not chunk.choices:
+                    continue
+                if chunk.choices[0].finish_reason is not None:
+                    final["finish_reason"] = chunk.choices[0].finish_reason
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    streamed.append(delta)
+                    yield delta
+        finally:
+            if "usage" not in final:
+                self.chat_limiter.reconcile(reserved, prompt_tokens + estimate_tokens(streamed, max_tokens=0))
+            # Releases the pooled connection when the reader stops early or the stream fails
+            await stream.close()
+
+    async def get_embeddings(self, texts: List[str]) -> List[list[float]]:
+        """
+        Get embeddings for a list of texts using Azure OpenAI.
+
+        Args:
+            texts: List of text strings to embed
+
+        Returns:
+            List of embeddings, in the same order as texts
+        """
+        try:
+            return await self.transport.run(self._embeddings(texts))
+        except Exception as e:
+            print(f"Error getting embeddings: {str(e)}")
+            raise
+
+    async def get_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        top_p: float = 1.0,
+        frequency_penalty: float = 0.0,
+        presence_penalty: float = 0.0,
+        response_format=None,
+    ) -> Dict[str, Any]:
+        """
+        Get chat completion from Azure OpenAI. Same arguments and return value as AzureClient.get_chat_completion.
+        """
+        kwargs = _chat_kwargs(messages, temperature, max_tokens, top_p, frequency_penalty, presence_penalty, response_format)
+        try:
+            return await self.transport.run(self._chat_completion(**kwargs))
+        except Exception as e:
+            print(f"Error getting chat completion: {str(e)}")
+            raise
+
+
+class AzureClient:
+    """
+    Sync facade over AsyncAzureClient, sharing its process-wide connection pool.
+    Safe to call from Streamlit script threads. Retries happen on the pool's loop,
+    see AsyncAzureClient.chat_retry_policy.
+    """
+
+    def __init__(
+        self,
+        chat_completion_model="gpt-4.1",
+        use_cache: bool = True,
+        cache=None,
+        cache_nondeterministic: bool = False,
+        priority: int = INTERACTIVE,
+    ):
+        self.async_client = AsyncAzureClient(
+            chat_completion_model=chat_completion_model,
+            use_cache=use_cache,
+            cache=cache,
+            cache_nondeterministic=cache_nondeterministic,
+            priority=priority,
+        )
+        self.transport = self.async_client.transport
+        self.endpoint = self.async_client.endpoint
+        self.api_version = self.async_client.api_version
+        self.embedding_deployment = self.async_client.embedding_deployment
+        self.chat_deployment = self.async_client.chat_deployment
+
     def get_embeddings(self, texts: List[str]) -> List[list[float]]:
         """
         Get embeddings for a list of texts using Azure OpenAI.
@@ -43,25 +397,15 @@ class AzureClient:
             texts: List of text strings to embed
             
         Returns:
-            Dictionary containing embeddings and metadata
+            List of embeddings, in the same order as texts
         """
         try:
-            response = self.client.embeddings.create(
-                input=texts,
-                model=self.embedding_deployment
-            )
-            
-            results = []
-            for item in response.data:
-                results.append(item.embedding)
-            
-            return results
+            return self.transport.run_sync(self.async_client._embeddings(texts))
             
         except Exception as e:
             print(f"Error getting embeddings: {str(e)}")
             raise
 
-    @retry(ExceptionToCheck=Exception, tries=3, delay=30, backoff=2)
     def get_chat_completion(
         self,
         messages: List[Dict[str, str]],
@@ -86,45 +430,58 @@ class AzureClient:
         Returns:
             Dictionary containing completion and metadata
         """
-
+        kwargs = _chat_kwargs(messages, temperature, max_tokens, top_p, frequency_penalty, presence_penalty, response_format)
         try:
-            if response_format:
-                response = self.client.chat.completions.create(
-                    model=self.chat_deployment,
-                    response_format=response_format,
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    top_p=top_p,
-                    frequency_penalty=frequency_penalty,
-                    presence_penalty=presence_penalty
-                )
-            else:
-                response = self.client.chat.completions.create(
-                    model=self.chat_deployment,
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    top_p=top_p,
-                    frequency_penalty=frequency_penalty,
-                    presence_penalty=presence_penalty
-                )
-            
-            return {
-                "content": response.choices[0].message.content,
-                "role": response.choices[0].message.role,
-                "finish_reason": response.choices[0].finish_reason,
-                "usage": {
-                    "prompt_tokens": response.usage.prompt_tokens,
-                    "completion_tokens": response.usage.completion_tokens,
-                    "total_tokens": response.usage.total_tokens
-                }
-            }
+            return self.transport.run_sync(self.async_client._chat_completion(**kwargs))
             
         except Exception as e:
             print(f"Error getting chat completion: {str(e)}")
             raise
 
+    def stream_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        top_p: float = 1.0,
+        frequency_penalty: float = 0.0,
+        presence_penalty: float = 0.0,
+        response_format=None,
+    ) -> Iterator[str]:
+        """
+        Stream a chat completion from Azure OpenAI, yielding content deltas as they arrive.
+
+        Takes the same arguments as get_chat_completion.
+
+        Yields:
+            Chunks of the assistant message content
+        """
+        kwargs = _chat_kwargs(messages, temperature, max_tokens, top_p, frequency_penalty, presence_penalty, response_format)
+        key = self.async_client.chat_cache_key(kwargs)
+        cached = self.async_client.cached_chat_completion(key)
+        if cached is not None:
+            yield cached["content"]
+            return
+
+        try:
+            stream, reserved, prompt_tokens = self.transport.run_sync(self.async_client._open_stream(**kwargs))
+            chunks = []
+            final = {}
+            for chunk in self.transport.iterate_sync(self.async_client._stream(stream, reserved, final, prompt_tokens)):
+                chunks.append(chunk)
+                yield chunk
+            # Only cached if the stream really finished with "stop", not cut off by length or a filter
+            self.async_client.cache_chat_completion(key, {
+                "content": "".join(chunks),
+                "role": "assistant",
+                "finish_reason": final.get("finish_reason"),
+                "usage": final.get("usage", {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}),
+            })
+
+        except Exception as e:
+            print(f"Error streaming chat completion: {str(e)}")
+            raise
+
 def main():
     # Example usage
     client = AzureClient()
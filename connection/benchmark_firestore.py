@@ -0,0 +1,54 @@
+"""
+Compare the latency of FireStore.insert_submission (one batched commit) with the previous
+two sequential add() calls, against the Firestore emulator:
+
+    gcloud emulators firestore start --host-port=localhost:8686
+    FIRESTORE_EMULATOR_HOST=localhost:8686 python -m connection.benchmark_firestore
+"""
+import os
+import statistics
+import time
+from datetime import datetime
+
+from connection.firestore import FireStore
+
+
+def sequential_insert(store: FireStore, results):
+    """The pre-batch implementation: user then submission, one round-trip each."""
+    _, record = store.users_collection.add({
+        "email": results["email"],
+        "first_name": results["first_name"],
+        'created_at': datetime.now(),
+    })
+    results.update({'created_at': datetime.now()})
+    _, submission_record = store.submission_collection.add({
+        "user_id": record.id,
+        'email': results["email"],
+        'content': results,
+    })
+    return submission_record.id
+
+
+def benchmark(fn, store: FireStore, runs: int) -> dict:
+    timings = []
+    for i in range(runs):
+        results = {"email": f"bench{i}@example.com", "first_name": "Bench", "num_bedrooms": 2}
+        start = time.perf_counter()
+        fn(store, results)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "median_ms": round(statistics.median(timings), 2),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 2),
+    }
+
+
+if __name__ == "__main__":
+    if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+        raise SystemExit("Set FIRESTORE_EMULATOR_HOST to run the benchmark against the emulator")
+    store = FireStore(project=os.getenv("FIRESTORE_PROJECT", "demo-uchi"))
+    runs = int(os.getenv("BENCHMARK_RUNS", 200))
+    # Warm up the channel so neither variant pays for connection setup
+    benchmark(FireStore.insert_submission, store, 5)
+    print("sequential add():", benchmark(sequential_insert, store, runs))
+    print("batched commit:  ", benchmark(FireStore.insert_submission, store, runs))
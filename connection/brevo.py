@@ -1,50 +1,154 @@
+import hashlib
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Optional
 
 from dotenv import load_dotenv
-from brevo_python import Configuration, ApiClient, SendSmtpEmail
+from brevo_python import Configuration, ApiClient, SendSmtpEmail, SendSmtpEmailMessageVersions, SendSmtpEmailTo1
 from brevo_python.api.transactional_emails_api import TransactionalEmailsApi
 from brevo_python.rest import ApiException
 
+from connection.brevo_stub import BrevoStubServer
+from utils import CircuitBreaker, RetryPolicy
+
+
+# Brevo accepts at most 1000 message versions per request
+MAX_MESSAGE_VERSIONS = 1000
+_EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+class BulkSendResult(NamedTuple):
+    email: str
+    ok: bool
+    message_id: Optional[str] = None
+    error: Optional[str] = None
+
 
 class Brevo:
     """
-    Minimal Brevo wrapper with a single method:
+    Minimal Brevo wrapper:
       send_welcome_email(recipient_email, first_name)
+      send_bulk_template_email(template_id, recipients)
+
+    With dry_run=True, requests go to a local BrevoStubServer instead and nothing is sent.
 
     Env vars:
-      - BREVO_API_KEY (required)
+      - BREVO_API_KEY (required, unless dry_run)
+      - BREVO_API_HOST (optional, defaults to https://api.brevo.com/v3)
       - BREVO_WELCOME_TEMPLATE_ID (optional if you pass template_id in __init__)
     """
 
-    def __init__(self):
+    def __init__(self, host: Optional[str] = None, dry_run: bool = False, max_connections: int = 8):
         load_dotenv()
         api_key = os.getenv("BREVO_API_KEY")
+        self.stub = None
+        if dry_run:
+            self.stub = BrevoStubServer().start()
+            host = self.stub.api_host
+            api_key = api_key or "dry-run"
 
         cfg = Configuration()
-        cfg.host = "https://api.brevo.com/v3"
+        cfg.host = host or os.getenv("BREVO_API_HOST", "https://api.brevo.com/v3")
         cfg.api_key["api-key"] = api_key
+        # Enough pooled connections for the concurrent bulk requests
+        cfg.connection_pool_maxsize = max_connections
         self._cfg = cfg  # reuse this config on every call
+        # One client for the lifetime of this object, so its urllib3 pool keeps connections alive
+        self._client = ApiClient(self._cfg)
+        self._api = TransactionalEmailsApi(self._client)
         self.welcome_template_id = 2
 
-    def send_welcome_email(self, recipient_email: str, first_name: str):
+    def send_welcome_email(self, recipient_email: str, first_name: str, idempotency_key: Optional[str] = None):
         """
         Sends the Welcome template to the given recipient.
+        With an idempotency_key, Brevo drops repeated sends of the same key, so a retried call
+        doesn't deliver the email twice.
         Returns the Brevo API response object on success, or raises ApiException on failure.
         """
         payload = SendSmtpEmail(
             to=[{"email": recipient_email, "name": first_name}],
             template_id=self.welcome_template_id,
             params={"firstName": first_name},
+            headers={"idempotencyKey": idempotency_key} if idempotency_key else None,
         )
 
         try:
-            client = ApiClient(self._cfg)
-            api = TransactionalEmailsApi(client)
-            return api.send_transac_email(payload)
+            return self._api.send_transac_email(payload)
 
         except ApiException as e:
             raise e
 
+    def send_bulk_template_email(
+        self,
+        template_id: int,
+        recipients: Iterable[Dict],
+        batch_size: int = MAX_MESSAGE_VERSIONS,
+        max_concurrency: int = 4,
+        idempotency_key: Optional[str] = None,
+    ) -> List[BulkSendResult]:
+        """
+        Sends a template to many recipients, personalised per recipient, in a handful of requests.
+
+        Each recipient ({"email", "name", "params"}) becomes one of a request's messageVersions,
+        up to 1000 per request, and at most `max_concurrency` requests are in flight. Transient
+        errors are retried per request; with an idempotency_key, each request gets a key derived
+        from it and the batch's recipients, so retries and re-runs of the same batch aren't
+        delivered twice, while a batch whose recipients changed is still sent.
+
+        Returns one BulkSendResult per recipient, in input order. Invalid addresses are reported
+        without being sent, and a request that fails marks all of its recipients as failed.
+        """
+        recipients = list(recipients)
+        results: List[Optional[BulkSendResult]] = [None] * len(recipients)
+        valid = []
+        for i, recipient in enumerate(recipients):
+            email = (recipient.get("email") or "").strip()
+            if _EMAIL_PATTERN.match(email):
+                valid.append(i)
+            else:
+                results[i] = BulkSendResult(email, False, error="invalid email address")
+
+        batch_size = min(batch_size, MAX_MESSAGE_VERSIONS)
+        batches = [valid[start:start + batch_size] for start in range(0, len(valid), batch_size)]
+        retry_policy = RetryPolicy(name="brevo", tries=4, deadline=60, breaker=CircuitBreaker.for_endpoint("brevo"))
+
+        def batch_key(indices: List[int]) -> str:
+            emails = sorted(recipients[i]["email"].strip().lower() for i in indices)
+            digest = hashlib.sha256("\n".join(emails).encode()).hexdigest()[:16]
+            return f"{idempotency_key}-{digest}"
+
+        def send_batch(number: int, indices: List[int]):
+            payload = SendSmtpEmail(
+                template_id=template_id,
+                message_versions=[
+                    SendSmtpEmailMessageVersions(
+                        to=[SendSmtpEmailTo1(email=recipients[i]["email"].strip(), name=recipients[i].get("name"))],
+                        params=recipients[i].get("params"),
+                    )
+                    for i in indices
+                ],
+                headers={"idempotencyKey": batch_key(indices)} if idempotency_key else None,
+            )
+            try:
+                response = retry_policy.call(self._api.send_transac_email, payload)
+            except Exception as e:
+                print(f"Error sending bulk batch {number} ({len(indices)} recipients): {str(e)}")
+                for i in indices:
+                    results[i] = BulkSendResult(recipients[i]["email"].strip(), False, error=str(e))
+                return
+            message_ids = response.message_ids or [response.message_id] * len(indices)
+            for i, message_id in zip(indices, message_ids):
+                results[i] = BulkSendResult(recipients[i]["email"].strip(), True, message_id=message_id)
+
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            list(executor.map(send_batch, range(len(batches)), batches))
+        return results
+
+    def close(self):
+        if self.stub is not None:
+            self.stub.stop()
+
 
 if __name__ == "__main__":
     brevo = Brevo()  # or rely on BREVO_WELCOME_TEMPLATE_ID
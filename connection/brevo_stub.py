@@ -0,0 +1,93 @@
+"""
+Local stand-in for Brevo's transactional email endpoint, for dry runs and load tests:
+accepts POST /v3/smtp/email, records the payload and returns fake message IDs without
+sending anything.
+
+    python -m connection.brevo_stub --port 8025
+    BREVO_API_HOST=http://127.0.0.1:8025/v3 python -m connection.send_digest ...
+"""
+import argparse
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "BrevoStubServer"
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v3/smtp/email":
+            return self._reply(404, {"code": "not_found", "message": f"No stub for {self.path}"})
+        if not self.headers.get("api-key"):
+            return self._reply(401, {"code": "unauthorized", "message": "Key not found"})
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except ValueError:
+            return self._reply(400, {"code": "bad_request", "message": "Invalid JSON"})
+
+        self.server.record(payload)
+        versions = payload.get("messageVersions")
+        if versions:
+            return self._reply(201, {"messageIds": [f"<{uuid.uuid4()}@stub.brevo>" for _ in versions]})
+        return self._reply(201, {"messageId": f"<{uuid.uuid4()}@stub.brevo>"})
+
+    def _reply(self, status: int, body: Dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class BrevoStubServer(ThreadingHTTPServer):
+    """Stub server running on a background thread. Use as a context manager, or start/stop."""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _Handler)
+        self.requests: List[Dict] = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def api_host(self) -> str:
+        """Value for Brevo(host=...) / BREVO_API_HOST."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v3"
+
+    def record(self, payload: Dict):
+        with self._lock:
+            self.requests.append(payload)
+
+    def start(self) -> "BrevoStubServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="brevo-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8025)
+    args = parser.parse_args()
+
+    server = BrevoStubServer(args.host, args.port)
+    print(f"Brevo stub listening on {server.api_host}")
+    server.serve_forever()
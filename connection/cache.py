@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional
+
+
+_MISSING = object()
+
+
+def make_cache_key(namespace: str, payload: Any) -> str:
+    """Stable hash of a JSON-serialisable payload, e.g. (deployment, messages, params)."""
+    serialized = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return f"{namespace}:{hashlib.sha256(serialized.encode('utf-8')).hexdigest()}"
+
+
+class LRUTTLCache:
+    """Thread-safe in-process cache evicting the least recently used entry, with a per-entry TTL."""
+
+    def __init__(self, max_entries: int = 2048, ttl: Optional[float] = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: str, value, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache:
+    """
+    On-disk cache shared by every worker process on the machine.
+
+    Uses WAL mode so readers don't block the writer. Values are pickled, so only point it at
+    a file this app owns. Expired rows are purged opportunistically on write, and the least
+    recently written rows are dropped once `max_entries` is exceeded.
+    """
+
+    def __init__(self, path: str, ttl: Optional[float] = 24 * 3600, max_entries: int = 100_000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL, written_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_written_at ON cache (written_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared across threads, keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str, default=None):
+        try:
+            row = self._connection().execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading cache: {str(e)}")
+            return default
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return default
+        return pickle.loads(row[0])
+
+    def set(self, key: str, value, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, written_at) VALUES (?, ?, ?, ?)",
+                (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), now + ttl if ttl else None, now),
+            )
+            self._writes += 1
+            if self._writes % 500 == 0:
+                self._evict(conn, now)
+        except sqlite3.Error as e:
+            print(f"Error writing cache: {str(e)}")
+
+    def delete(self, key: str):
+        self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        conn.execute(
+            "DELETE FROM cache WHERE key IN ("
+            "SELECT key FROM cache ORDER BY written_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+
+class TieredCache:
+    """Looks up tiers in order (fastest first) and back-fills the faster tiers on a hit."""
+
+    def __init__(self, tiers: List):
+        self.tiers = tiers
+
+    def get(self, key: str, default=None):
+        for i, tier in enumerate(self.tiers):
+            value = tier.get(key, _MISSING)
+            if value is not _MISSING:
+                for faster in self.tiers[:i]:
+                    faster.set(key, value)
+                return value
+        return default
+
+    def set(self, key: str, value, ttl: Optional[float] = None):
+        for tier in self.tiers:
+            tier.set(key, value, ttl)
+
+    def delete(self, key: str):
+        for tier in self.tiers:
+            tier.delete(key)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """
+    Process-wide cache for Azure OpenAI responses.
+
+    Env vars:
+      - AZURE_OPENAI_CACHE_MAX_ENTRIES (default 2048)
+      - AZURE_OPENAI_CACHE_TTL seconds (default 3600)
+      - AZURE_OPENAI_CACHE_PATH: if set, adds an SQLite tier at this path shared across processes
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            ttl = float(os.getenv("AZURE_OPENAI_CACHE_TTL", 3600))
+            tiers = [LRUTTLCache(int(os.getenv("AZURE_OPENAI_CACHE_MAX_ENTRIES", 2048)), ttl)]
+            path = os.getenv("AZURE_OPENAI_CACHE_PATH")
+            if path:
+                tiers.append(SQLiteCache(path, ttl=ttl))
+            _default_cache = TieredCache(tiers)
+        return _default_cache
@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional, Set
+
+from connection.brevo import Brevo
+from utils import CircuitBreaker, CircuitOpenError, RetryPolicy, is_retryable_error
+
+
+DEFAULT_OUTBOX_PATH = "brevo_outbox.db"
+
+
+def _recipient_key(prefix: str, email: str) -> str:
+    return f"{prefix}-" + hashlib.sha256(email.strip().lower().encode("utf-8")).hexdigest()
+
+
+class EmailOutbox:
+    """
+    Local outbox for transactional emails, so a form submit never waits on Brevo.
+
+    `enqueue_*` only inserts a row into a SQLite file (WAL mode, shared by every worker process
+    on the machine). A background thread claims due rows and sends them through one Brevo
+    client, retrying transient errors (429/5xx/timeouts) with backoff, first within a send and
+    then across polls. Permanent errors (other 4xx) and rows out of attempts are marked failed.
+
+    Each row's ID doubles as the Brevo idempotency key, so a row sent again after a crash
+    between the send and the status update is not delivered twice.
+
+    Args:
+        brevo: Brevo client, created on first send if omitted
+        path: SQLite file, defaults to BREVO_OUTBOX_PATH or brevo_outbox.db
+        poll_interval: seconds between checks for due rows when idle
+        max_attempts: sends (each with its own in-call retries) before a row is marked failed
+        lease_seconds: a row stuck in "sending" for longer (crashed worker) is picked up again
+    """
+
+    def __init__(
+        self,
+        brevo: Optional[Brevo] = None,
+        path: Optional[str] = None,
+        poll_interval: float = 5,
+        max_attempts: int = 8,
+        lease_seconds: float = 300,
+    ):
+        self._brevo = brevo
+        self.path = path or os.getenv("BREVO_OUTBOX_PATH", DEFAULT_OUTBOX_PATH)
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.retry_policy = RetryPolicy(
+            name="brevo",
+            tries=3,
+            deadline=30,
+            breaker=CircuitBreaker.for_endpoint("brevo"),
+        )
+        self._local = threading.local()
+        self._wake = threading.Event()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, "
+                "status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, "
+                "next_attempt_at REAL NOT NULL, claimed_at REAL, last_error TEXT, "
+                "created_at REAL NOT NULL, sent_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at)")
+
+    @property
+    def brevo(self) -> Brevo:
+        if self._brevo is None:
+            self._brevo = Brevo()
+        return self._brevo
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared across threads, keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, kind: str, payload: Dict, idempotency_key: str) -> bool:
+        """Queue an email, returning False if one with the same key is already queued or sent."""
+        now = time.time()
+        inserted = self._connection().execute(
+            "INSERT OR IGNORE INTO outbox (id, kind, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)",
+            (idempotency_key, kind, json.dumps(payload), now, now),
+        ).rowcount == 1
+        if inserted:
+            self.start()
+            self._wake.set()
+        return inserted
+
+    def enqueue_welcome_email(self, recipient_email: str, first_name: str) -> bool:
+        # One welcome email per address, however many times the form is submitted
+        return self.enqueue("welcome", {"email": recipient_email, "first_name": first_name},
+                            _recipient_key("welcome", recipient_email))
+
+    def sent_to(self, campaign: str, emails: Iterable[str]) -> Set[str]:
+        """Which of the emails were recorded as sent for a bulk campaign (e.g. one week's digest)."""
+        emails = list(emails)
+        keys = {_recipient_key(campaign, email): email for email in emails}
+        conn = self._connection()
+        sent = set()
+        key_list = list(keys)
+        # Stay under SQLite's limit on bound parameters
+        for start in range(0, len(key_list), 500):
+            chunk = key_list[start:start + 500]
+            rows = conn.execute(
+                f"SELECT id FROM outbox WHERE status = 'sent' AND id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            sent.update(keys[row_id] for row_id, in rows)
+        return sent
+
+    def record_sent(self, campaign: str, emails: Iterable[str]):
+        """
+        Record emails a bulk campaign was delivered to outside the outbox, so a re-run skips them.
+        The rows are stored as already sent and never picked up by the sender thread.
+        """
+        now = time.time()
+        self._connection().executemany(
+            "INSERT OR IGNORE INTO outbox (id, kind, payload, status, attempts, next_attempt_at, created_at, sent_at) "
+            "VALUES (?, ?, ?, 'sent', 1, ?, ?, ?)",
+            [(_recipient_key(campaign, email), campaign, json.dumps({"email": email}), now, now, now) for email in emails],
+        )
+
+    def start(self):
+        """Start the background sender thread if it isn't running."""
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="email-outbox", daemon=True)
+                self._worker.start()
+
+    def stats(self) -> Dict[str, int]:
+        rows = self._connection().execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+        return dict(rows)
+
+    def _run(self):
+        while True:
+            try:
+                sent_any = self.process_due()
+            except Exception as e:
+                print(f"Error processing email outbox: {str(e)}")
+                sent_any = False
+            if not sent_any:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def process_due(self, limit: int = 20) -> bool:
+        """Send up to `limit` due emails, returning True if any row was processed."""
+        now = time.time()
+        rows = self._connection().execute(
+            "SELECT id, kind, payload, attempts FROM outbox "
+            "WHERE (status = 'pending' AND next_attempt_at <= ?) OR (status = 'sending' AND claimed_at <= ?) "
+            "ORDER BY next_attempt_at LIMIT ?",
+            (now, now - self.lease_seconds, limit),
+        ).fetchall()
+        processed = False
+        for row_id, kind, payload, attempts in rows:
+            if self._claim(row_id, now):
+                processed = True
+                self._send(row_id, kind, json.loads(payload), attempts + 1)
+        return processed
+
+    def _claim(self, row_id: str, now: float) -> bool:
+        # Only one worker (thread or process) wins the conditional update
+        return self._connection().execute(
+            "UPDATE outbox SET status = 'sending', claimed_at = ? "
+            "WHERE id = ? AND (status = 'pending' OR (status = 'sending' AND claimed_at <= ?))",
+            (now, row_id, now - self.lease_seconds),
+        ).rowcount == 1
+
+    def _send(self, row_id: str, kind: str, payload: Dict, attempt: int):
+        try:
+            if kind == "welcome":
+                self.retry_policy.call(
+                    self.brevo.send_welcome_email, payload["email"], payload["first_name"], idempotency_key=row_id
+                )
+            else:
+                raise ValueError(f"Unknown email kind {kind}")
+        except Exception as e:
+            retryable = is_retryable_error(e) or isinstance(e, CircuitOpenError)
+            if retryable and attempt < self.max_attempts:
+                # Back off across polls too: ~30s, 1m, 2m, ... capped at an hour
+                delay = min(3600, 30 * 2 ** (attempt - 1)) * random.uniform(0.5, 1)
+                print(f"Error sending {kind} email {row_id}, retrying in {delay:.0f}s: {str(e)}")
+                self._connection().execute(
+                    "UPDATE outbox SET status = 'pending', attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                    (attempt, time.time() + delay, str(e), row_id),
+                )
+            else:
+                print(f"Error sending {kind} email {row_id}, giving up: {str(e)}")
+                self._connection().execute(
+                    "UPDATE outbox SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+                    (attempt, str(e), row_id),
+                )
+            return
+        self._connection().execute(
+            "UPDATE outbox SET status = 'sent', attempts = ?, sent_at = ?, last_error = NULL WHERE id = ?",
+            (attempt, time.time(), row_id),
+        )
@@ -0,0 +1,124 @@
+import asyncio
+import time
+from typing import List, Optional
+
+import numpy as np
+import tiktoken
+
+from connection.azure_client import AsyncAzureClient
+from connection.rate_limiter import BACKGROUND
+
+
+class EmbeddingPipeline:
+    """
+    Bulk embeddings for user preferences, tags and listing descriptions.
+
+    Texts are deduplicated, split into requests that respect the per-request input count and
+    token limits, and embedded concurrently under a request rate limit. The result is a
+    contiguous float32 matrix with one row per input text, in input order, instead of lists
+    of Python floats (~4x less memory).
+
+    Args:
+        client: AsyncAzureClient to use, a BACKGROUND priority one is created if omitted
+        max_batch_inputs: maximum number of texts per request (Azure allows 2048)
+        max_batch_tokens: maximum total tokens per request
+        max_input_tokens: longer texts are truncated to this many tokens (model limit 8191)
+        max_concurrency: maximum number of requests in flight
+        requests_per_minute: pace requests to stay under this rate, None for no limit
+    """
+
+    def __init__(
+        self,
+        client: Optional[AsyncAzureClient] = None,
+        max_batch_inputs: int = 2048,
+        max_batch_tokens: int = 100_000,
+        max_input_tokens: int = 8191,
+        max_concurrency: int = 4,
+        requests_per_minute: Optional[int] = None,
+        encoding: str = "cl100k_base",
+    ):
+        self.client = client or AsyncAzureClient(priority=BACKGROUND)
+        self.max_batch_inputs = max_batch_inputs
+        self.max_batch_tokens = max_batch_tokens
+        self.max_input_tokens = max_input_tokens
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        try:
+            self.encoding = tiktoken.get_encoding(encoding)
+        except Exception as e:
+            print(f"Could not load tokenizer {encoding}, estimating token counts: {str(e)}")
+            self.encoding = None
+        self._next_request_at = 0.0
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Sync entry point, runs the pipeline on the shared transport's event loop."""
+        return self.client.transport.run_sync(self.aembed(texts))
+
+    async def aembed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts, returning a (len(texts), dim) float32 matrix in input order."""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        unique_texts = list(dict.fromkeys(texts))
+        row_of = {text: i for i, text in enumerate(unique_texts)}
+        inverse = np.fromiter((row_of[text] for text in texts), dtype=np.intp, count=len(texts))
+
+        prepared = [self._truncate(text) for text in unique_texts]
+        batches = self._batches([self._count_tokens(text) for text in prepared])
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        lock = asyncio.Lock()
+        matrix = None
+
+        async def run_batch(start: int, end: int):
+            nonlocal matrix
+            async with semaphore:
+                await self._pace(lock)
+                embeddings = await self.client.get_embeddings(prepared[start:end])
+            block = np.asarray(embeddings, dtype=np.float32)
+            if matrix is None:
+                matrix = np.empty((len(unique_texts), block.shape[1]), dtype=np.float32)
+            matrix[start:end] = block
+
+        await asyncio.gather(*(run_batch(start, end) for start, end in batches))
+        # Fancy indexing copies into a new contiguous array, expanding duplicates back out
+        return matrix[inverse]
+
+    def _count_tokens(self, text: str) -> int:
+        if self.encoding is None:
+            return len(text) // 4 + 1
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def _truncate(self, text: str) -> str:
+        # The API rejects empty strings
+        text = text if text.strip() else " "
+        if self.encoding is None:
+            return text[:self.max_input_tokens * 4]
+        tokens = self.encoding.encode(text, disallowed_special=())
+        if len(tokens) <= self.max_input_tokens:
+            return text
+        print(f"Truncating embedding input from {len(tokens)} to {self.max_input_tokens} tokens")
+        return self.encoding.decode(tokens[:self.max_input_tokens])
+
+    def _batches(self, token_counts: List[int]) -> List[tuple]:
+        """Split into contiguous (start, end) ranges within the input and token limits."""
+        batches = []
+        start, tokens = 0, 0
+        for i, count in enumerate(token_counts):
+            if i > start and (i - start >= self.max_batch_inputs or tokens + count > self.max_batch_tokens):
+                batches.append((start, i))
+                start, tokens = i, 0
+            tokens += count
+        batches.append((start, len(token_counts)))
+        return batches
+
+    async def _pace(self, lock: asyncio.Lock):
+        if not self.requests_per_minute:
+            return
+        async with lock:
+            interval = 60 / self.requests_per_minute
+            now = time.monotonic()
+            wait = self._next_request_at - now
+            self._next_request_at = max(now, self._next_request_at) + interval
+        if wait > 0:
+            await asyncio.sleep(wait)
@@ -0,0 +1,119 @@
+"""
+Stream users or submissions out of Firestore to JSONL or Parquet, one page at a time,
+for analytics and reprocessing jobs:
+
+    python -m connection.export_firestore submissions submissions.jsonl --credential-path firestore-key.json
+    python -m connection.export_firestore users users.parquet --fields email first_name created_at \
+        --created-after 2025-01-01 --credential-path firestore-key.json
+
+The format follows the output file's extension (.parquet, anything else is JSONL), "-" writes
+JSONL to stdout. Parquet needs pyarrow; nested values are stored as JSON strings, and the columns
+are those of the first page, so pass --fields when documents don't share the same fields.
+"""
+import argparse
+import json
+import sys
+from datetime import date, datetime
+from typing import Dict, Iterable, Iterator, List
+
+from connection.firestore import EXPORT_PAGE_SIZE, FireStore
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def write_jsonl(rows: Iterable[Dict], out) -> int:
+    count = 0
+    for row in rows:
+        out.write(json.dumps(row, default=_json_default, ensure_ascii=False))
+        out.write("\n")
+        count += 1
+    return count
+
+
+def _chunks(rows: Iterable[Dict], size: int) -> Iterator[List[Dict]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _flatten(row: Dict) -> Dict:
+    return {
+        key: json.dumps(value, default=_json_default, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+        for key, value in row.items()
+    }
+
+
+def write_parquet(rows: Iterable[Dict], path: str, row_group_size: int = 10_000) -> int:
+    """Write rows in row groups of `row_group_size`, the only rows held in memory."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Parquet export needs pyarrow: pip install pyarrow")
+
+    writer = None
+    columns = None
+    count = 0
+    try:
+        for chunk in _chunks(rows, row_group_size):
+            chunk = [_flatten(row) for row in chunk]
+            if writer is None:
+                table = pa.Table.from_pylist(chunk)
+                columns = set(table.column_names)
+                writer = pq.ParquetWriter(path, table.schema)
+            else:
+                dropped = {key for row in chunk for key in row} - columns
+                if dropped:
+                    print(f"Dropping fields missing from the first page: {sorted(dropped)}", file=sys.stderr)
+                    columns |= dropped
+                table = pa.Table.from_pylist(chunk, schema=writer.schema)
+            writer.write_table(table)
+            count += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+def _parse_datetime(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("collection", choices=["users", "submissions"])
+    parser.add_argument("output", help='.jsonl or .parquet file, "-" for JSONL on stdout')
+    parser.add_argument("--fields", nargs="+", help="only export these fields (dotted paths for nested ones)")
+    parser.add_argument("--created-after", type=_parse_datetime, help="ISO date or datetime, inclusive")
+    parser.add_argument("--created-before", type=_parse_datetime, help="ISO date or datetime, exclusive")
+    parser.add_argument("--page-size", type=int, default=EXPORT_PAGE_SIZE)
+    parser.add_argument("--credential-path", help="service account JSON, omit to use the emulator")
+    parser.add_argument("--project", help="project ID when using the emulator")
+    args = parser.parse_args()
+
+    store = FireStore(credential_info_path=args.credential_path, project=args.project)
+    iterate = store.iter_users if args.collection == "users" else store.iter_submissions
+    rows = iterate(
+        page_size=args.page_size,
+        fields=args.fields,
+        created_after=args.created_after,
+        created_before=args.created_before,
+    )
+
+    if args.output.endswith(".parquet"):
+        exported = write_parquet(rows, args.output)
+    elif args.output == "-":
+        exported = write_jsonl(rows, sys.stdout)
+    else:
+        with open(args.output, "w", encoding="utf-8") as out:
+            exported = write_jsonl(rows, out)
+    print(f"Exported {exported} {args.collection}", file=sys.stderr)
@@ -1,51 +1,229 @@
-from typing import List, Dict, Optional
+import hashlib
+from typing import Dict, Iterator, List, Optional, Sequence
 
+from google.api_core.exceptions import AlreadyExists
 from google.cloud import firestore
 from datetime import datetime
 
 from utils import read_json
 
 
+WARM_UP_DOCUMENT_ID = "_warm_up"
+# Seconds, so an unreachable Firestore does not stall the first page load
+WARM_UP_TIMEOUT = 5
+EXPORT_PAGE_SIZE = 500
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+def user_id_for_email(email: str) -> str:
+    """Deterministic users document ID for an email address."""
+    return hashlib.sha256(normalize_email(email).encode("utf-8")).hexdigest()
+
+
 class FireStore:
-    def __init__(self, credential_info: Optional[Dict] = None, credential_info_path: Optional[str] = None):
+    """
+    Users and submissions store. The underlying client is thread-safe and keeps its gRPC
+    channel open, so build one per process (see resources.get_firestore) and share it.
+    """
+    client_class = firestore.Client
+
+    def __init__(
+        self,
+        credential_info: Optional[Dict] = None,
+        credential_info_path: Optional[str] = None,
+        project: Optional[str] = None,
+    ):
         if credential_info:
-            self.db = firestore.Client.from_service_account_info(credential_info)
+            self.db = self.client_class.from_service_account_info(credential_info)
+        elif credential_info_path:
+            self.db = self.client_class.from_service_account_json(credential_info_path)
         else:
-            self.db = firestore.Client.from_service_account_json(credential_info_path)
+            # No credentials needed against the emulator (FIRESTORE_EMULATOR_HOST)
+            self.db = self.client_class(project=project)
         self.users_collection = self.db.collection('users')
         self.submission_collection = self.db.collection('submissions')
 
-    def insert_submission(self, results):
-        # Create the new user
+    def warm_up(self) -> bool:
+        """
+        Open the gRPC channel (credentials, TLS, HTTP/2) ahead of the first submit by reading
+        a document that doesn't exist. The channel is otherwise only created lazily.
+        """
+        try:
+            self.users_collection.document(WARM_UP_DOCUMENT_ID).get(retry=None, timeout=WARM_UP_TIMEOUT)
+            return True
+        except Exception as e:
+            print(f"Error warming up Firestore: {str(e)}")
+            return False
+
+    def _submission_writes(self, results):
+        # Users are keyed by their normalised email and submission IDs are generated client side,
+        # so the user upsert and the submission insert commit atomically in one batch:
+        # no lookup query, no duplicate users, and no orphan user if the submission write fails
+        user_ref = self.users_collection.document(user_id_for_email(results["email"]))
+        submission_ref = self.submission_collection.document()
+
         user_fields = {
-            "email": results["email"],
+            "email": normalize_email(results["email"]),
             "first_name": results["first_name"],
-            'created_at': datetime.now(),
+            'updated_at': datetime.now(),
         }
-        # Do check to see if the user already exists.
-        _, record = self.users_collection.add(user_fields)
-        user_id = record.path.split("/")[-1]
 
         # Store the submission
         results.update({'created_at': datetime.now()})
-        _, submission_record = self.db.collection('submissions').add({
-            "user_id": user_id,
+        submission_fields = {
+            "user_id": user_ref.id,
             'email': results["email"],
             'content': results,
-        })
-        
+        }
+        return user_ref, user_fields, submission_ref, submission_fields
+
+    def _submission_batch(self, user_ref, user_fields, submission_ref, submission_fields, create_user: bool):
+        batch = self.db.batch()
+        if create_user:
+            batch.create(user_ref, {**user_fields, 'created_at': user_fields['updated_at']})
+        else:
+            batch.set(user_ref, user_fields, merge=True)
+        batch.set(submission_ref, submission_fields)
+        return batch
+
+    def insert_submission(self, results):
+        writes = self._submission_writes(results)
+        try:
+            # Optimistically create the user, a single round-trip for new users
+            self._submission_batch(*writes, create_user=True).commit()
+        except AlreadyExists:
+            # Returning user: keep their created_at and update the rest
+            self._submission_batch(*writes, create_user=False).commit()
+
         # Return the submission document ID
-        submission_id = submission_record.path.split("/")[-1]
-        return submission_id
+        return writes[2].id
+
+    def get_user_by_email(self, email: str) -> Optional[Dict]:
+        """O(1) lookup of a user by email, via its deterministic document ID."""
+        snapshot = self.users_collection.document(user_id_for_email(email)).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    def _page_query(self, collection, page_size: int, fields: Optional[Sequence[str]],
+                    created_field: str, created_after: Optional[datetime], created_before: Optional[datetime]):
+        """
+        Query for one page of an export. Pages are ordered by document ID, or by the created
+        field then document ID when it is range-filtered, so a page resumes after the last
+        snapshot of the previous one with no offset to skip over.
+        """
+        query = collection
+        if created_after is not None:
+            query = query.where(filter=firestore.FieldFilter(created_field, ">=", created_after))
+        if created_before is not None:
+            query = query.where(filter=firestore.FieldFilter(created_field, "<", created_before))
+        if created_after is not None or created_before is not None:
+            query = query.order_by(created_field)
+            if fields is not None and created_field not in fields:
+                # The cursor needs the ordering field in each snapshot
+                fields = [*fields, created_field]
+        query = query.order_by("__name__")
+        if fields is not None:
+            query = query.select(fields)
+        return query.limit(page_size)
+
+    def _iter_documents(self, collection, page_size: int, fields: Optional[Sequence[str]],
+                        created_field: str, created_after: Optional[datetime],
+                        created_before: Optional[datetime], include_id: bool = True) -> Iterator[Dict]:
+        query = self._page_query(collection, page_size, fields, created_field, created_after, created_before)
+        last = None
+        while True:
+            page = list((query.start_after(last) if last is not None else query).stream())
+            for snapshot in page:
+                yield {"id": snapshot.id, **snapshot.to_dict()} if include_id else snapshot.to_dict()
+            if len(page) < page_size:
+                return
+            last = page[-1]
+
+    def iter_users(
+        self,
+        page_size: int = EXPORT_PAGE_SIZE,
+        fields: Optional[Sequence[str]] = None,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+    ) -> Iterator[Dict]:
+        """
+        Stream users one page at a time, as dicts with their document "id".
+
+        Args:
+            page_size: documents fetched per request, only one page is held in memory
+            fields: only return these fields (projection), all fields if omitted
+            created_after: only users created at or after this time
+            created_before: only users created before this time
+        """
+        return self._iter_documents(
+            self.users_collection, page_size, fields, "created_at", created_after, created_before
+        )
+
+    def iter_submissions(
+        self,
+        page_size: int = EXPORT_PAGE_SIZE,
+        fields: Optional[Sequence[str]] = None,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+    ) -> Iterator[Dict]:
+        """Stream submissions one page at a time, see iter_users. Filters on content.created_at."""
+        return self._iter_documents(
+            self.submission_collection, page_size, fields, "content.created_at", created_after, created_before
+        )
 
     def list_all_users(self) -> List[Dict]:
-        users_stream = self.db.collection('users').stream()
-        users = []
-        for doc in users_stream:
-            print('{} => {}'.format(doc.id, doc.to_dict()))
-            users.append(doc.to_dict())
-        return users
+        """Every user's fields, fetched page by page. Use iter_users for their document IDs."""
+        return list(self._iter_documents(self.users_collection, EXPORT_PAGE_SIZE, None, "created_at", None, None,
+                                         include_id=False))
+
+
+class AsyncFireStore(FireStore):
+    """
+    FireStore on firestore.AsyncClient, for callers running on an event loop.
+    The same writes, awaited instead of blocking a thread. Its gRPC channel is bound to
+    the loop it is first used on, so share one instance per loop rather than per process.
+    """
+    client_class = firestore.AsyncClient
+
+    async def warm_up(self) -> bool:
+        try:
+            await self.users_collection.document(WARM_UP_DOCUMENT_ID).get(retry=None, timeout=WARM_UP_TIMEOUT)
+            return True
+        except Exception as e:
+            print(f"Error warming up Firestore: {str(e)}")
+            return False
+
+    async def insert_submission(self, results):
+        writes = self._submission_writes(results)
+        try:
+            await self._submission_batch(*writes, create_user=True).commit()
+        except AlreadyExists:
+            await self._submission_batch(*writes, create_user=False).commit()
+        return writes[2].id
+
+    async def get_user_by_email(self, email: str) -> Optional[Dict]:
+        snapshot = await self.users_collection.document(user_id_for_email(email)).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    async def _iter_documents(self, collection, page_size: int, fields: Optional[Sequence[str]],
+                              created_field: str, created_after: Optional[datetime],
+                              created_before: Optional[datetime], include_id: bool = True):
+        query = self._page_query(collection, page_size, fields, created_field, created_after, created_before)
+        last = None
+        while True:
+            page = [doc async for doc in (query.start_after(last) if last is not None else query).stream()]
+            for snapshot in page:
+                yield {"id": snapshot.id, **snapshot.to_dict()} if include_id else snapshot.to_dict()
+            if len(page) < page_size:
+                return
+            last = page[-1]
 
+    async def list_all_users(self) -> List[Dict]:
+        return [user async for user in self._iter_documents(
+            self.users_collection, EXPORT_PAGE_SIZE, None, "created_at", None, None, include_id=False
+        )]
 
 if __name__ == '__main__':
     firestore = FireStore(credential_info_path="firestore-key.json")
@@ -0,0 +1,89 @@
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT: Tuple[float, float] = (3.05, 10)
+POOL_MAXSIZE = 20
+
+
+class HostMetrics:
+    """Latency counters of the requests sent to one host."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, error: bool):
+        with self._lock:
+            self.requests += 1
+            self.errors += int(error)
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "avg_seconds": round(self.total_seconds / self.requests, 4) if self.requests else 0.0,
+                "max_seconds": round(self.max_seconds, 4),
+            }
+
+
+_sessions: Dict[str, requests.Session] = {}
+_metrics: Dict[str, HostMetrics] = {}
+_lock = threading.Lock()
+
+
+def get_session(host: str) -> requests.Session:
+    """
+    Process-wide requests.Session for a host, keeping up to POOL_MAXSIZE keep-alive connections
+    so repeated calls skip the TCP and TLS handshakes. The underlying urllib3 pool is thread-safe.
+    """
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[host] = session
+            _metrics[host] = HostMetrics()
+        return session
+
+
+def request(method: str, url: str, timeout: Optional[Tuple[float, float]] = DEFAULT_TIMEOUT, **kwargs) -> requests.Response:
+    """Send a request through the pooled session for the URL's host, recording its latency."""
+    host = urlsplit(url).netloc
+    session = get_session(host)
+    start = time.perf_counter()
+    error = True
+    try:
+        response = session.request(method, url, timeout=timeout, **kwargs)
+        error = response.status_code >= 500
+        return response
+    finally:
+        _metrics[host].record(time.perf_counter() - start, error)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def latency_metrics() -> Dict[str, Dict[str, float]]:
+    """Per-host latency snapshot, e.g. to log or show on an admin page."""
+    with _lock:
+        return {host: metrics.snapshot() for host, metrics in _metrics.items()}
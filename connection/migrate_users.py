@@ -0,0 +1,92 @@
+"""
+One-off migration of the users collection to email-keyed document IDs.
+
+Before insert_submission upserted users by email, every submission created a new users doc.
+This streams the collection in pages and moves each user to the document ID derived from its
+normalised email, merging duplicates into one (earliest created_at, latest first_name) and
+re-pointing their submissions. Dry run by default:
+
+    python -m connection.migrate_users --credential-path firestore-key.json
+    python -m connection.migrate_users --credential-path firestore-key.json --apply
+"""
+import argparse
+from typing import Dict, Optional
+
+from connection.firestore import FireStore, normalize_email, user_id_for_email
+
+
+def iter_user_pages(store: FireStore, page_size: int):
+    """Yield pages of user snapshots ordered by document ID, so memory stays at one page."""
+    last = None
+    while True:
+        query = store.users_collection.order_by("__name__").limit(page_size)
+        if last is not None:
+            query = query.start_after(last)
+        page = list(query.stream())
+        if not page:
+            return
+        yield page
+        last = page[-1]
+
+
+def _merged_user(target: Optional[Dict], duplicate: Dict, email: str) -> Dict:
+    merged = dict(target or {})
+    merged["email"] = email
+    created = [d["created_at"] for d in (target, duplicate) if d and d.get("created_at")]
+    if created:
+        merged["created_at"] = min(created)
+    # The most recent record carries the latest first name
+    target_created = (target or {}).get("created_at")
+    duplicate_created = duplicate.get("created_at")
+    is_newer = not target_created or (duplicate_created and duplicate_created >= target_created)
+    if duplicate.get("first_name") and (is_newer or not merged.get("first_name")):
+        merged["first_name"] = duplicate["first_name"]
+    return merged
+
+
+def migrate(store: FireStore, apply: bool = False, page_size: int = 300) -> Dict[str, int]:
+    stats = {"users": 0, "moved": 0, "merged": 0, "submissions": 0, "skipped": 0}
+    for page in iter_user_pages(store, page_size):
+        for snapshot in page:
+            stats["users"] += 1
+            user = snapshot.to_dict()
+            if not user.get("email"):
+                stats["skipped"] += 1
+                continue
+            email = normalize_email(user["email"])
+            target_id = user_id_for_email(email)
+            if snapshot.id == target_id:
+                continue
+
+            target_ref = store.users_collection.document(target_id)
+            target = target_ref.get()
+            stats["merged" if target.exists else "moved"] += 1
+            submissions = list(store.submission_collection.where("user_id", "==", snapshot.id).stream())
+            stats["submissions"] += len(submissions)
+            print(f"{snapshot.id} -> {target_id} ({email}), {len(submissions)} submissions"
+                  f"{', merging' if target.exists else ''}")
+            if not apply:
+                continue
+
+            # A batch holds at most 500 writes, leave room for the user writes
+            for start in range(0, max(len(submissions), 1), 450):
+                batch = store.db.batch()
+                for submission in submissions[start:start + 450]:
+                    batch.update(submission.reference, {"user_id": target_id})
+                if start + 450 >= len(submissions):
+                    batch.set(target_ref, _merged_user(target.to_dict() if target.exists else None, user, email))
+                    batch.delete(snapshot.reference)
+                batch.commit()
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--credential-path", help="service account JSON, omit to use the emulator")
+    parser.add_argument("--project", help="project ID when using the emulator")
+    parser.add_argument("--page-size", type=int, default=300)
+    parser.add_argument("--apply", action="store_true", help="write the changes, otherwise only print them")
+    args = parser.parse_args()
+
+    store = FireStore(credential_info_path=args.credential_path, project=args.project)
+    print(migrate(store, apply=args.apply, page_size=args.page_size))
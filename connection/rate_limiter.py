@@ -0,0 +1,258 @@
+import asyncio
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+
+# Lower values are served first
+INTERACTIVE = 0
+BACKGROUND = 10
+
+# Runs the SQLite bucket updates, so a contended lock never stalls the shared event loop.
+# One thread keeps them in order.
+_sqlite_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rate-limiter")
+
+
+class RateLimitWaitError(Exception):
+    """A request waited longer than the limiter's timeout for its turn."""
+
+
+class _MemoryBuckets:
+    """Request and token buckets held in this process."""
+
+    blocking = False
+
+    def __init__(self, requests_per_minute: Optional[float], tokens_per_minute: Optional[float]):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self.requests = requests_per_minute or 0
+        self.tokens = tokens_per_minute or 0
+        self.updated_at = time.monotonic()
+
+    def take(self, tokens: int) -> float:
+        """Take one request and `tokens` tokens, or return how many seconds until they are available."""
+        now = time.monotonic()
+        self.requests, self.tokens = _refill(self.rpm, self.tpm, self.requests, self.tokens, now - self.updated_at)
+        self.updated_at = now
+        wait = _wait_time(self.rpm, self.tpm, self.requests, self.tokens, tokens)
+        if wait == 0:
+            self.requests -= 1 if self.rpm else 0
+            self.tokens -= min(tokens, self.tpm) if self.tpm else 0
+        return wait
+
+    def adjust(self, tokens: int):
+        """Return (negative) or charge (positive) tokens once the real usage is known."""
+        if self.tpm:
+            self.tokens = min(self.tpm, self.tokens - tokens)
+
+
+class _SQLiteBuckets:
+    """
+    Request and token buckets in a local SQLite file, shared by every process on the machine.
+    Each take/adjust is one short IMMEDIATE transaction, which can block while another
+    process holds the lock, so the limiter runs them on _sqlite_executor.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str, name: str, requests_per_minute: Optional[float], tokens_per_minute: Optional[float]):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self.name = name
+        self.conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, requests REAL, tokens REAL, updated_at REAL)"
+        )
+        self.conn.execute(
+            "INSERT OR IGNORE INTO buckets VALUES (?, ?, ?, ?)",
+            (name, requests_per_minute or 0, tokens_per_minute or 0, time.time()),
+        )
+        self._lock = threading.Lock()
+
+    def _update(self, tokens: int, charge_only: bool) -> float:
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                requests, level, updated_at = self.conn.execute(
+                    "SELECT requests, tokens, updated_at FROM buckets WHERE name = ?", (self.name,)
+                ).fetchone()
+                now = time.time()
+                requests, level = _refill(self.rpm, self.tpm, requests, level, now - updated_at)
+                wait = 0.0
+                if charge_only:
+                    if self.tpm:
+                        level = min(self.tpm, level - tokens)
+                else:
+                    wait = _wait_time(self.rpm, self.tpm, requests, level, tokens)
+                    if wait == 0:
+                        requests -= 1 if self.rpm else 0
+                        level -= min(tokens, self.tpm) if self.tpm else 0
+                self.conn.execute(
+                    "UPDATE buckets SET requests = ?, tokens = ?, updated_at = ? WHERE name = ?",
+                    (requests, level, now, self.name),
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            return wait
+
+    def take(self, tokens: int) -> float:
+        return self._update(tokens, charge_only=False)
+
+    def adjust(self, tokens: int):
+        self._update(tokens, charge_only=True)
+
+
+def _refill(rpm, tpm, requests, tokens, elapsed):
+    if rpm:
+        requests = min(rpm, requests + elapsed * rpm / 60)
+    if tpm:
+        tokens = min(tpm, tokens + elapsed * tpm / 60)
+    return requests, tokens
+
+
+def _wait_time(rpm, tpm, requests, level, tokens) -> float:
+    wait = 0.0
+    if rpm and requests < 1:
+        wait = max(wait, (1 - requests) * 60 / rpm)
+    if tpm:
+        # A single request can never need more than a full bucket
+        needed = min(tokens, tpm)
+        if level < needed:
+            wait = max(wait, (needed - level) * 60 / tpm)
+    return wait
+
+
+class RateLimiter:
+    """
+    Client-side token bucket for one Azure deployment, accounting for requests/min and tokens/min.
+
+    Callers reserve an estimate of the tokens a request will use and reconcile it with the
+    `usage` from the response, so the bucket tracks real consumption. Waiters are served by
+    priority (INTERACTIVE before BACKGROUND), then in arrival order, so chat turns jump ahead
+    of signup extraction and embedding jobs.
+
+    All acquisitions happen on the shared Azure transport's event loop, which makes one
+    limiter per deployment process-wide. Set `state_path` to share the buckets across
+    processes through a local SQLite file.
+    """
+
+    _registry: Dict[str, "RateLimiter"] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        state_path: Optional[str] = None,
+        timeout: Optional[float] = 60,
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.enabled = bool(requests_per_minute or tokens_per_minute)
+        if state_path:
+            self.buckets = _SQLiteBuckets(state_path, name, requests_per_minute, tokens_per_minute)
+        else:
+            self.buckets = _MemoryBuckets(requests_per_minute, tokens_per_minute)
+        self._waiters = []
+        self._counter = itertools.count()
+        self._pump_task = None
+        self.wait_seconds = 0.0
+
+    @classmethod
+    def for_deployment(cls, name: str) -> "RateLimiter":
+        """
+        Process-wide limiter for a deployment.
+
+        Env vars (limits are off unless set):
+          - AZURE_OPENAI_RPM: requests per minute per deployment
+          - AZURE_OPENAI_TPM: tokens per minute per deployment
+          - AZURE_OPENAI_RATE_LIMIT_PATH: SQLite file to share the buckets across processes
+          - AZURE_OPENAI_RATE_LIMIT_TIMEOUT: seconds a request may wait for its turn (default 60)
+        """
+        with cls._registry_lock:
+            if name not in cls._registry:
+                rpm = os.getenv("AZURE_OPENAI_RPM")
+                tpm = os.getenv("AZURE_OPENAI_TPM")
+                cls._registry[name] = cls(
+                    name,
+                    requests_per_minute=float(rpm) if rpm else None,
+                    tokens_per_minute=float(tpm) if tpm else None,
+                    state_path=os.getenv("AZURE_OPENAI_RATE_LIMIT_PATH"),
+                    timeout=float(os.getenv("AZURE_OPENAI_RATE_LIMIT_TIMEOUT", 60)),
+                )
+            return cls._registry[name]
+
+    async def acquire(self, tokens: int, priority: int = INTERACTIVE):
+        """
+        Wait until one request and `tokens` tokens can be taken from the buckets, raising
+        RateLimitWaitError after `timeout` seconds.
+        """
+        if not self.enabled:
+            return
+        start = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), tokens, future))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.ensure_future(self._pump())
+        try:
+            # Cancelling the future on timeout takes it out of the queue
+            await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            raise RateLimitWaitError(f"Waited over {self.timeout}s for {self.name}") from None
+        finally:
+            self.wait_seconds += time.monotonic() - start
+
+    def reconcile(self, reserved_tokens: int, used_tokens: Optional[int]):
+        """Correct the token bucket once the response's usage is known, or with 0 after a failed request."""
+        if self.enabled and used_tokens is not None:
+            if self.buckets.blocking:
+                _sqlite_executor.submit(self._adjust, used_tokens - reserved_tokens)
+            else:
+                self.buckets.adjust(used_tokens - reserved_tokens)
+
+    def _adjust(self, tokens: int):
+        try:
+            self.buckets.adjust(tokens)
+        except Exception as e:
+            print(f"Error adjusting rate limit buckets for {self.name}: {str(e)}")
+
+    async def _take(self, tokens: int) -> float:
+        if self.buckets.blocking:
+            return await asyncio.get_running_loop().run_in_executor(_sqlite_executor, self.buckets.take, tokens)
+        return self.buckets.take(tokens)
+
+    async def _pump(self):
+        while self._waiters:
+            entry = self._waiters[0]
+            priority, _, tokens, future = entry
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            wait = await self._take(tokens)
+            if wait == 0:
+                # Others may have queued while the buckets were updated, so it's not necessarily first
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                if future.done():
+                    # Timed out while the buckets were updated, give the tokens back
+                    self.reconcile(tokens, 0)
+                else:
+                    future.set_result(None)
+                continue
+            # Re-check regularly so a higher priority request arriving meanwhile goes first
+            await asyncio.sleep(min(wait, 0.25))
+
+
+def estimate_tokens(texts, max_tokens: Optional[int] = None, default_completion_tokens: int = 500) -> int:
+    """Rough token estimate (~4 characters per token) to reserve before a request is sent."""
+    prompt_tokens = sum(len(str(text)) for text in texts) // 4 + 1
+    return prompt_tokens + (max_tokens if max_tokens is not None else default_completion_tokens)
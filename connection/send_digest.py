@@ -0,0 +1,87 @@
+"""
+Send the weekly digest template to every user, in batches of up to 1000 recipients per request:
+
+    python -m connection.send_digest --template-id 5 --credential-path firestore-key.json
+    python -m connection.send_digest --template-id 5 --credential-path firestore-key.json --dry-run
+
+--dry-run sends to a local stub server instead of Brevo and reports what would have been sent.
+Everyone the digest reached is recorded in the email outbox, so re-running in the same ISO week
+(e.g. after new users signed up) only sends to those who haven't had it yet.
+"""
+import argparse
+from datetime import date
+from typing import Dict, List
+
+from connection.brevo import MAX_MESSAGE_VERSIONS, Brevo, BulkSendResult
+from connection.email_outbox import EmailOutbox
+from connection.firestore import FireStore
+
+
+def send_digest(
+    brevo: Brevo,
+    outbox: EmailOutbox,
+    template_id: int,
+    recipients: List[Dict],
+    campaign: str,
+    batch_size: int = MAX_MESSAGE_VERSIONS,
+    max_concurrency: int = 4,
+    record: bool = True,
+) -> List[BulkSendResult]:
+    """
+    Send the campaign to the recipients it wasn't recorded as sent to, then record who it reached
+    (unless record=False, as for a dry run). Returns the results of this run's sends.
+    """
+    already_sent = outbox.sent_to(campaign, (recipient["email"] for recipient in recipients))
+    pending = [recipient for recipient in recipients if recipient["email"] not in already_sent]
+    if already_sent:
+        print(f"Skipping {len(recipients) - len(pending)} recipients already sent {campaign}")
+    results = brevo.send_bulk_template_email(
+        template_id,
+        pending,
+        batch_size=batch_size,
+        max_concurrency=max_concurrency,
+        idempotency_key=campaign,
+    )
+    if record:
+        outbox.record_sent(campaign, [result.email for result in results if result.ok])
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--template-id", type=int, required=True)
+    parser.add_argument("--batch-size", type=int, default=MAX_MESSAGE_VERSIONS)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--dry-run", action="store_true", help="send to a local stub server instead of Brevo")
+    parser.add_argument("--credential-path", help="service account JSON, omit to use the emulator")
+    parser.add_argument("--project", help="project ID when using the emulator")
+    parser.add_argument("--outbox-path", help="SQLite outbox recording who was sent the digest")
+    args = parser.parse_args()
+
+    store = FireStore(credential_info_path=args.credential_path, project=args.project)
+    recipients = [
+        {"email": user["email"], "name": user.get("first_name"), "params": {"firstName": user.get("first_name")}}
+        for user in store.iter_users(fields=["email", "first_name"])
+        if user.get("email")
+    ]
+
+    year, week, _ = date.today().isocalendar()
+    brevo = Brevo(dry_run=args.dry_run, max_connections=args.concurrency)
+    try:
+        results = send_digest(
+            brevo,
+            EmailOutbox(brevo, path=args.outbox_path),
+            args.template_id,
+            recipients,
+            campaign=f"digest-{args.template_id}-{year}-W{week:02d}",
+            batch_size=args.batch_size,
+            max_concurrency=args.concurrency,
+            record=not args.dry_run,
+        )
+    finally:
+        brevo.close()
+
+    failed = [result for result in results if not result.ok]
+    print(f"Sent {len(results) - len(failed)} of {len(results)} digests{' (dry run)' if args.dry_run else ''}")
+    for result in failed:
+        print(f"  {result.email}: {result.error}")
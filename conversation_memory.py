@@ -0,0 +1,144 @@
+from typing import Callable, Dict, List, Optional
+
+import tiktoken
+
+
+SUMMARY_PROMPT = """
+You maintain a running summary of a conversation between a property search assistant and a customer.
+Update the summary with the new messages. Keep facts the customer stated, their open questions and anything
+the assistant promised. Do not repeat the structured customer information, it is tracked separately.
+Reply with the updated summary only, in at most {max_words} words.
+"""
+
+
+def message_role(msg: Dict) -> str:
+    """Role of a chat message stored either as {"role": ...} or as a serialised langchain message."""
+    if msg.get("role"):
+        return msg["role"]
+    return "user" if msg.get("type") == "human" else "assistant"
+
+
+def llm_summarizer(client, max_words: int = 120) -> Callable[[str, List[Dict]], str]:
+    """Build a summarizer that folds messages into the running summary using an AzureClient."""
+    def summarize(summary: str, messages: List[Dict]) -> str:
+        transcript = "\n".join(f"{message_role(msg)}: {msg['content']}" for msg in messages)
+        response = client.get_chat_completion(
+            [
+                {"role": "system", "content": SUMMARY_PROMPT.format(max_words=max_words)},
+                {"role": "user", "content": f"Current summary:\n{summary or '(empty)'}\n\nNew messages:\n{transcript}"},
+            ],
+            temperature=0,
+            max_tokens=max_words * 2,
+        )
+        return response["content"].strip()
+    return summarize
+
+
+class ConversationMemory:
+    """
+    Rolling window memory for the chat agent.
+
+    The last `max_turns` user/assistant exchanges are sent verbatim. Older messages are folded,
+    `fold_batch` at a time, into a running summary kept in the per-session memory state, so
+    the prompt stops growing with the length of the chat. The structured customer_info is
+    already part of the system prompt, so the summary only needs to carry the rest.
+
+    A token budget is enforced with a local tokenizer: if the prompt is still over
+    `max_prompt_tokens`, more of the window is folded into the summary.
+
+    The memory state is a plain dict (kept in st.session_state) with keys:
+      - summary: str, running summary of the folded messages
+      - summarized_upto: int, number of leading messages already folded into the summary
+    """
+
+    def __init__(
+        self,
+        max_turns: int = 4,
+        max_prompt_tokens: int = 3000,
+        max_summary_tokens: int = 300,
+        fold_batch: int = 4,
+        summarizer: Optional[Callable[[str, List[Dict]], str]] = None,
+        encoding: str = "o200k_base",
+    ):
+        self.max_turns = max_turns
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_summary_tokens = max_summary_tokens
+        self.fold_batch = fold_batch
+        self.summarizer = summarizer
+        try:
+            self.encoding = tiktoken.get_encoding(encoding)
+        except Exception as e:
+            # The encoding file is fetched once and cached; without it fall back to an estimate
+            print(f"Could not load tokenizer {encoding}, estimating token counts: {str(e)}")
+            self.encoding = None
+
+    @staticmethod
+    def new_state() -> Dict:
+        return {"summary": "", "summarized_upto": 0}
+
+    def count_tokens(self, text: str) -> int:
+        if self.encoding is None:
+            return len(text) // 4 + 1
+        return len(self.encoding.encode(text))
+
+    def build_messages(self, system_prompt: str, messages: List[Dict], state: Dict) -> List[Dict]:
+        """Return the messages to send to the LLM, folding old turns into state["summary"]."""
+        start = min(state.get("summarized_upto", 0), len(messages))
+        window_start = max(start, len(messages) - 2 * self.max_turns)
+
+        # Fold in batches so the summarizer runs every few turns rather than on every turn
+        if window_start - start >= self.fold_batch:
+            start = self._fold(messages, start, window_start, state)
+        else:
+            window_start = start
+
+        # Enforce the token budget by folding more of the window, keeping at least the latest message
+        budget = self.max_prompt_tokens - self.count_tokens(system_prompt) - self.count_tokens(state.get("summary", ""))
+        window = [self._format(msg) for msg in messages[window_start:]]
+        window_tokens = [self.count_tokens(msg["content"]) + 4 for msg in window]
+        overflow = 0
+        while sum(window_tokens[overflow:]) > budget and overflow < len(window) - 1:
+            overflow += 1
+        if overflow:
+            self._fold(messages, start, window_start + overflow, state)
+            window = window[overflow:]
+
+        formatted_messages = [{"role": "system", "content": system_prompt}]
+        if state.get("summary"):
+            formatted_messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation: {state['summary']}"
+            })
+        return formatted_messages + window
+
+    def _format(self, msg: Dict) -> Dict:
+        return {"role": message_role(msg), "content": msg["content"]}
+
+    def _fold(self, messages: List[Dict], start: int, end: int, state: Dict) -> int:
+        to_fold = messages[start:end]
+        summary = state.get("summary", "")
+        if self.summarizer:
+            try:
+                summary = self.summarizer(summary, to_fold)
+            except Exception as e:
+                print(f"Error summarising conversation, keeping an extractive summary: {str(e)}")
+                summary = self._extractive_summary(summary, to_fold)
+        else:
+            summary = self._extractive_summary(summary, to_fold)
+
+        state["summary"] = self._truncate(summary)
+        state["summarized_upto"] = end
+        return end
+
+    def _extractive_summary(self, summary: str, messages: List[Dict]) -> str:
+        # Without an LLM keep what the customer said, it carries most of the requirements
+        said = " ".join(msg["content"] for msg in messages if message_role(msg) == "user")
+        return f"{summary} Customer said: {said}".strip()
+
+    def _truncate(self, summary: str) -> str:
+        if self.count_tokens(summary) <= self.max_summary_tokens:
+            return summary
+        if self.encoding is None:
+            return summary[-self.max_summary_tokens * 4:]
+        # Keep the most recent part of the summary
+        return self.encoding.decode(self.encoding.encode(summary)[-self.max_summary_tokens:])
@@ -1,4 +1,4 @@
-from typing import TypedDict, List, Optional
+from typing import TypedDict, Dict, List, Optional
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import BaseMessage
 import json
@@ -6,6 +6,8 @@ from dotenv import load_dotenv
 import os
 
 from connection.azure_client import AzureClient
+from connection.rate_limiter import BACKGROUND
+from rule_extractor import FieldMatch, RuleBasedExtractor, merge_rule_matches
 
 # Load environment variables
 load_dotenv()
@@ -26,14 +28,125 @@ class CustomerInfo(TypedDict):
     property_type: str
     number_of_rooms: int
     timeline: str
+    has_children: Optional[bool]
     additional_notes: Optional[str]
 
+
+# Fields needed to pre-fill the signup form, once these are known the extractor is skipped
+REQUIRED_FIELDS = [
+    "first_name", "email", "motivation", "is_first_time_buyer", "is_buying_alone",
+    "preferred_location", "maximum_budget", "property_type", "number_of_rooms", "timeline",
+]
+
+# property_agent is free to name fields its own way
+FIELD_ALIASES = {
+    "name": "first_name",
+    "num_bedrooms": "number_of_rooms",
+    "number_of_bedrooms": "number_of_rooms",
+    "budget": "maximum_budget",
+    "location": "preferred_location",
+    "has_child": "has_children",
+    "notes": "additional_notes",
+}
+
+INT_FIELDS = {"maximum_budget", "number_of_rooms"}
+BOOL_FIELDS = {"is_first_time_buyer", "is_buying_alone", "has_children"}
+
+
+def _to_int(value) -> Optional[int]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    digits = "".join(c for c in str(value) if c.isdigit() or c == ".")
+    try:
+        return int(float(digits)) if digits else None
+    except ValueError:
+        return None
+
+
+def _to_bool(value) -> Optional[bool]:
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ("true", "yes", "y", "1"):
+        return True
+    if text in ("false", "no", "n", "0"):
+        return False
+    return None
+
+
+def _to_property_type(value) -> Optional[str]:
+    values = value if isinstance(value, (list, tuple)) else [value]
+    kinds = set()
+    for v in values:
+        text = str(v).lower()
+        if "both" in text:
+            kinds.update(["apartment", "house"])
+        if "house" in text:
+            kinds.add("house")
+        if "apartment" in text or "flat" in text:
+            kinds.add("apartment")
+    if len(kinds) == 2:
+        return "both"
+    return kinds.pop() if kinds else None
+
+
+def normalize_customer_info(info: Optional[dict]) -> CustomerInfo:
+    """Validate a raw dict from an LLM into CustomerInfo types, dropping empty or unparseable values."""
+    normalized = {}
+    for key, value in (info or {}).items():
+        key = FIELD_ALIASES.get(key, key)
+        if value is None or value == "" or value == []:
+            continue
+        if key in INT_FIELDS:
+            value = _to_int(value)
+        elif key in BOOL_FIELDS:
+            value = _to_bool(value)
+        elif key == "property_type":
+            value = _to_property_type(value)
+        elif isinstance(value, str):
+            value = value.strip()
+        if value is not None and value != "":
+            normalized[key] = value
+    return CustomerInfo(**normalized)
+
+
 class CustomerInfoProcessor:
     def __init__(self):
-        self.client = AzureClient(chat_completion_model="gpt-4o-mini")
-        
-    def process_conversation(self, messages: List[BaseMessage]) -> CustomerInfo:
-        """Process the conversation and extract structured customer information."""
+        # Extraction gives way to live chat turns when the deployment is rate limited
+        self.client = AzureClient(chat_completion_model="gpt-4o-mini", priority=BACKGROUND)
+        self.rules = RuleBasedExtractor()
+
+    def apply_rule_matches(self, customer_info: Optional[dict], matches: Dict[str, FieldMatch]) -> CustomerInfo:
+        """Merge fields found by the rule-based extractor into the customer info."""
+        return normalize_customer_info(merge_rule_matches(normalize_customer_info(customer_info), matches))
+
+    def extract_with_rules(self, customer_info: Optional[dict], messages: List[dict]) -> CustomerInfo:
+        """Fill what we can from the user's messages locally, without an LLM call."""
+        return self.apply_rule_matches(customer_info, self.rules.extract_messages(messages))
+
+    @staticmethod
+    def merge_extracted_info(customer_info: Optional[dict], extracted_info: Optional[dict]) -> CustomerInfo:
+        """Merge one turn's extracted_info into the customer info collected so far, newer values win."""
+        merged = dict(normalize_customer_info(customer_info))
+        merged.update(normalize_customer_info(extracted_info))
+        return CustomerInfo(**merged)
+
+    @staticmethod
+    def missing_fields(customer_info: Optional[dict]) -> List[str]:
+        return [field for field in REQUIRED_FIELDS if (customer_info or {}).get(field) is None]
+
+    def is_complete(self, customer_info: Optional[dict]) -> bool:
+        return not self.missing_fields(customer_info)
+
+    def process_conversation(self, messages: List[BaseMessage], known_info: Optional[CustomerInfo] = None) -> CustomerInfo:
+        """
+        Process the conversation and extract structured customer information.
+
+        If known_info is given, messages only need to be the turns since the last extraction:
+        the LLM is told what is already known and the result is merged on top of it.
+        """
         system_prompt = """
         You are an information extraction agent for Uchi AI. Your task is to extract structured customer information from the conversation.
         
@@ -60,6 +173,12 @@ class CustomerInfoProcessor:
         4. Clean and normalize text data
         5. Validate email format if present
         """
+        if known_info is not None:
+            system_prompt += f"""
+        Information already known from earlier in the conversation, keep it unless the messages below change it:
+        {json.dumps(known_info)}
+        Fields still missing: {", ".join(self.missing_fields(known_info))}
+        """
         
         # Convert messages to the format expected by the LLM
         formatted_messages = [
@@ -77,9 +196,16 @@ class CustomerInfoProcessor:
         
         try:
             customer_info = json.loads(response['content'])
-            return CustomerInfo(**customer_info)
         except json.JSONDecodeError as e:
             raise ValueError(f"Failed to parse customer information from conversation due to {str(e)}")
+        if not isinstance(customer_info, dict):
+            raise ValueError(
+                f"Failed to parse customer information from conversation due to a JSON {type(customer_info).__name__} "
+                "instead of an object"
+            )
+        if known_info is not None:
+            return self.merge_extracted_info(known_info, customer_info)
+        return normalize_customer_info(customer_info)
 
     def generate_signup_url(self, customer_info: CustomerInfo) -> str:
         """Generate a signup URL with the customer information as parameters."""
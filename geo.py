@@ -0,0 +1,278 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+EARTH_RADIUS_KM = 6371.0088
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def to_unit_vectors(lat, lon) -> np.ndarray:
+    """(n, 3) points on the unit sphere, where straight-line (chord) distance grows with the great-circle distance."""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.ascontiguousarray(np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1))
+
+
+def km_to_chord(distance_km):
+    return 2 * np.sin(np.minimum(np.asarray(distance_km, dtype=np.float64), np.pi * EARTH_RADIUS_KM) / (2 * EARTH_RADIUS_KM))
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord, dtype=np.float64) / 2, 0, 1))
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle distance in km, broadcasting over array arguments."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def proximity_score(distance_km, scale_km: float = 1.0) -> np.ndarray:
+    """1 at the doorstep, decaying exponentially with distance (~0.37 at scale_km)."""
+    return np.exp(-np.asarray(distance_km, dtype=np.float64) / scale_km)
+
+
+class GeoIndex:
+    """
+    KD-tree over unit-sphere vectors, answering great-circle radius and k-nearest queries
+    for whole batches of query points at once. Radii are converted to chord lengths, which
+    preserve the ordering of haversine distances, so results are exact on the sphere.
+    """
+
+    def __init__(self, xyz: np.ndarray):
+        self.size = len(xyz)
+        # copy_data=False keeps a memory-mapped array as the tree's data instead of copying it
+        self.tree = cKDTree(xyz, copy_data=False, balanced_tree=False) if self.size else None
+
+    @classmethod
+    def from_lat_lon(cls, lat, lon) -> "GeoIndex":
+        return cls(to_unit_vectors(lat, lon))
+
+    def nearest(self, lat, lon, k: int = 1, max_km: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Distances (km) and indices of the k nearest points to each query point, both (n, k).
+        Missing neighbours (fewer than k points, or none within max_km) have distance inf and index len(index).
+        """
+        query = to_unit_vectors(lat, lon).reshape(-1, 3)
+        if self.tree is None:
+            return np.full((len(query), k), np.inf), np.full((len(query), k), self.size, dtype=np.intp)
+        upper = km_to_chord(max_km) if max_km is not None else np.inf
+        chords, indices = self.tree.query(query, k=k, distance_upper_bound=upper, workers=-1)
+        chords, indices = chords.reshape(len(query), k), indices.reshape(len(query), k)
+        missing = np.isinf(chords)
+        distances = chord_to_km(np.where(missing, 0, chords))
+        distances[missing] = np.inf
+        return distances, indices
+
+    def within(self, lat, lon, radius_km: float) -> List[np.ndarray]:
+        """Indices of the points within radius_km of each query point."""
+        query = to_unit_vectors(lat, lon).reshape(-1, 3)
+        if self.tree is None:
+            return [np.empty(0, dtype=np.intp) for _ in range(len(query))]
+        return [np.asarray(ids, dtype=np.intp) for ids in self.tree.query_ball_point(query, km_to_chord(radius_km), workers=-1)]
+
+    def count_within(self, lat, lon, radius_km: float) -> np.ndarray:
+        query = to_unit_vectors(lat, lon).reshape(-1, 3)
+        if self.tree is None:
+            return np.zeros(len(query), dtype=np.intp)
+        return self.tree.query_ball_point(query, km_to_chord(radius_km), return_length=True, workers=-1)
+
+    def any_within(self, lat, lon, radius_km: float) -> np.ndarray:
+        """Boolean mask of the query points with at least one point within radius_km."""
+        distances, _ = self.nearest(lat, lon, k=1, max_km=radius_km)
+        return np.isfinite(distances[:, 0])
+
+
+class PointSet:
+    """
+    Columns of a dataset (lat, lon and attributes) as NumPy arrays, usually memory-mapped
+    from the .npy cache written by load_points. Spatial indexes over the whole set or a
+    filtered subset (e.g. outstanding primary schools) are built on first use and kept.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], version: str = "", xyz: Optional[np.ndarray] = None):
+        self.columns = columns
+        self.version = version
+        self._xyz = xyz
+        self._indexes: Dict[tuple, Tuple[GeoIndex, np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.columns["lat"])
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    @property
+    def lat(self) -> np.ndarray:
+        return self.columns["lat"]
+
+    @property
+    def lon(self) -> np.ndarray:
+        return self.columns["lon"]
+
+    @property
+    def xyz(self) -> np.ndarray:
+        if self._xyz is None:
+            self._xyz = to_unit_vectors(self.lat, self.lon)
+        return self._xyz
+
+    def mask(self, **equals) -> np.ndarray:
+        """Rows whose columns equal the given values, a list of values matches any of them."""
+        mask = np.ones(len(self), dtype=bool)
+        for column, value in equals.items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            mask &= np.isin(self.columns[column], list(values))
+        return mask
+
+    def index(self, **equals) -> Tuple[GeoIndex, np.ndarray]:
+        """Spatial index over the rows matching `equals`, and those rows' positions in the set."""
+        key = tuple(sorted((column, str(value)) for column, value in equals.items()))
+        with self._lock:
+            if key not in self._indexes:
+                if equals:
+                    rows = np.flatnonzero(self.mask(**equals))
+                    self._indexes[key] = (GeoIndex(np.ascontiguousarray(self.xyz[rows])), rows)
+                else:
+                    self._indexes[key] = (GeoIndex(self.xyz), np.arange(len(self)))
+            return self._indexes[key]
+
+    def near(self, other: "PointSet", radius_km: float, **other_equals) -> np.ndarray:
+        """
+        Boolean mask of this set's points within radius_km of any point of `other` matching
+        other_equals, e.g. properties.near(schools, 1, phase="primary", rating="outstanding").
+        """
+        index, _ = other.index(**other_equals)
+        return index.any_within(self.lat, self.lon, radius_km)
+
+    def nearest_in(self, other: "PointSet", k: int = 1, **other_equals) -> Tuple[np.ndarray, np.ndarray]:
+        """Distances (km) to and rows of the k nearest matching points of `other`, for every point of this set."""
+        index, rows = other.index(**other_equals)
+        distances, positions = index.nearest(self.lat, self.lon, k=k)
+        # Missing neighbours point one past the end, map them to -1
+        padded = np.append(rows, -1)
+        return distances, padded[positions]
+
+
+def _parse_column(values: List[str]) -> np.ndarray:
+    try:
+        return np.array([int(v) for v in values], dtype=np.int64)
+    except ValueError:
+        pass
+    try:
+        return np.array([float(v) if v != "" else np.nan for v in values], dtype=np.float64)
+    except ValueError:
+        return np.array(values, dtype=np.str_)
+
+
+def _file_version(path: str) -> str:
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def build_cache(csv_path: str, cache_dir: str) -> str:
+    """
+    Convert a CSV with lat/lon columns into one .npy file per column, plus the unit vectors and
+    a manifest of the columns, in cache_dir/<version>. The directory is built under a temporary
+    name and renamed into place before cache_dir/_version points at it, so files other processes
+    have memory-mapped are never overwritten. Older versions are removed.
+    """
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    columns = {name: _parse_column([row[name] for row in rows]) for name in (rows[0].keys() if rows else ["lat", "lon"])}
+    version = _file_version(csv_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    build_dir = tempfile.mkdtemp(prefix=".build-", dir=cache_dir)
+    try:
+        for name, values in columns.items():
+            np.save(os.path.join(build_dir, f"{name}.npy"), values)
+        np.save(os.path.join(build_dir, "_xyz.npy"), to_unit_vectors(columns["lat"], columns["lon"]))
+        with open(os.path.join(build_dir, "_columns.json"), "w") as f:
+            json.dump(list(columns), f)
+        try:
+            os.replace(build_dir, os.path.join(cache_dir, version))
+        except OSError:
+            # Another process has just built the same version
+            shutil.rmtree(build_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+
+    pointer = os.path.join(cache_dir, f".version-{os.getpid()}")
+    with open(pointer, "w") as f:
+        f.write(version)
+    os.replace(pointer, os.path.join(cache_dir, "_version"))
+
+    # Mapped files of removed versions stay readable until the processes using them unmap them
+    for entry in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, entry)
+        if entry != version and os.path.isdir(path) and not entry.startswith("."):
+            shutil.rmtree(path, ignore_errors=True)
+        elif entry.endswith(".npy"):
+            # Left by the flat layout of earlier builds
+            os.remove(path)
+    return version
+
+
+def _load_version(cache_dir: str, version: str) -> "PointSet":
+    version_dir = os.path.join(cache_dir, version)
+    with open(os.path.join(version_dir, "_columns.json")) as f:
+        names = json.load(f)
+    columns = {name: np.load(os.path.join(version_dir, f"{name}.npy"), mmap_mode="r") for name in names}
+    xyz = np.load(os.path.join(version_dir, "_xyz.npy"), mmap_mode="r")
+    return PointSet(columns, version=version, xyz=xyz)
+
+
+_loaded: Dict[str, PointSet] = {}
+_loaded_lock = threading.Lock()
+
+
+def load_points(name: str, data_dir: str = DATA_DIR) -> PointSet:
+    """
+    Process-wide PointSet for data/<name>.csv. The CSV is converted to .npy files under
+    data/cache/<name>/<version> once (and again whenever it changes), then every load
+    memory-maps the columns in that version's manifest, so startup reads only the pages that
+    queries touch.
+    """
+    csv_path = os.path.join(data_dir, f"{name}.csv")
+    cache_dir = os.path.join(data_dir, "cache", name)
+    version = _file_version(csv_path)
+    with _loaded_lock:
+        points = _loaded.get(name)
+        if points is not None and points.version == version:
+            return points
+        try:
+            with open(os.path.join(cache_dir, "_version")) as f:
+                cached_version = f.read().strip()
+        except FileNotFoundError:
+            cached_version = None
+        if cached_version != version:
+            build_cache(csv_path, cache_dir)
+        try:
+            points = _load_version(cache_dir, version)
+        except FileNotFoundError:
+            # A cache from before version directories, or removed by a concurrent rebuild
+            build_cache(csv_path, cache_dir)
+            points = _load_version(cache_dir, version)
+        _loaded[name] = points
+        return points
+
+
+if __name__ == "__main__":
+    schools = load_points("schools")
+    properties = load_points("properties")
+    near_outstanding = properties.near(schools, 2, phase="primary", rating="outstanding")
+    distances, rows = properties.nearest_in(schools, k=1, phase="primary")
+    for i in range(len(properties)):
+        print(f"{properties['name'][i]}: nearest primary {schools['name'][rows[i, 0]]} "
+              f"{distances[i, 0]:.2f}km, outstanding within 2km: {near_outstanding[i]}")
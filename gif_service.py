@@ -1,38 +1,119 @@
-import requests
-import random
+import glob
 import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 
+from connection import http_session
 
-class GifService:
-    def __init__(self):
-        self.api_key = os.getenv("GIPHY_API_KEY")
-        self.fallback_gif = "https://media.giphy.com/media/3o7TKsQ8UQZrJtXXLi/giphy.gif"
 
-    def get_random_gif(self, keyword: str) -> str:
-        """Get a random GIF from Giphy based on keyword."""
-        if not self.api_key:
-            return self.fallback_gif
+GIPHY_SEARCH_URL = "https://api.giphy.com/v1/gifs/search"
+# GIFs bundled with the app, shown while a keyword's results are loading or when Giphy is unreachable
+LOCAL_GIF_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "gifs")
+
+
+class GifCatalog:
+    """
+    Process-wide cache of Giphy search results per keyword.
+
+    pick() never calls Giphy: it returns a random URL from the keyword's cached results, or a
+    bundled local GIF if they haven't been fetched yet. Missing keywords are fetched and entries
+    older than `ttl` seconds are refreshed on a background thread, keeping the stale results
+    until the refresh succeeds, so GIF selection adds no network latency to page loads.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, api_key: Optional[str] = None, ttl: float = 6 * 3600, results_per_keyword: int = 25):
+        self.api_key = api_key
+        self.ttl = ttl
+        self.results_per_keyword = results_per_keyword
+        # keyword -> (urls, fetched_at)
+        self._entries: Dict[str, Tuple[List[str], float]] = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="gif-catalog")
+        self.local_gifs = sorted(glob.glob(os.path.join(LOCAL_GIF_DIR, "*.gif")))
+
+    @classmethod
+    def get(cls) -> "GifCatalog":
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(api_key=os.getenv("GIPHY_API_KEY"))
+            return cls._instance
 
-        url = f"https://api.giphy.com/v1/gifs/search?api_key={self.api_key}&q={keyword}&limit=10"
+    def prefetch(self, keywords: List[str]):
+        """Start fetching keywords in the background, e.g. at startup."""
+        for keyword in keywords:
+            self._schedule(keyword)
 
+    def pick(self, keyword: str) -> str:
+        """Random GIF URL (or local path) for a keyword, from memory."""
+        with self._lock:
+            entry = self._entries.get(keyword)
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            self._schedule(keyword)
+        if entry and entry[0]:
+            return random.choice(entry[0])
+        return self.fallback()
+
+    def fallback(self) -> str:
+        if self.local_gifs:
+            return random.choice(self.local_gifs)
+        return "https://media.giphy.com/media/3o7TKsQ8UQZrJtXXLi/giphy.gif"
+
+    def _schedule(self, keyword: str):
+        if not self.api_key:
+            return
+        with self._lock:
+            if keyword in self._pending:
+                return
+            self._pending.add(keyword)
+        self._executor.submit(self._refresh, keyword)
+
+    def _refresh(self, keyword: str):
         try:
-            response = requests.get(url)
-            data = response.json()
-            gifs = data.get("data", [])
-            if gifs:
-                return random.choice(gifs)["images"]["original"]["url"]
-            return self.fallback_gif
-        except Exception:
-            return self.fallback_gif
+            response = http_session.get(
+                GIPHY_SEARCH_URL,
+                params={"api_key": self.api_key, "q": keyword, "limit": self.results_per_keyword},
+                timeout=(2, 3),
+            )
+            response.raise_for_status()
+            urls = [gif["images"]["original"]["url"] for gif in response.json().get("data", [])]
+            if urls:
+                with self._lock:
+                    self._entries[keyword] = (urls, time.monotonic())
+        except Exception as e:
+            print(f"Error fetching GIFs for {keyword}: {str(e)}")
+        finally:
+            with self._lock:
+                self._pending.discard(keyword)
+
+
+class GifService:
+    GREETING_KEYWORDS = ["hello there"]
+    CELEBRATION_KEYWORDS = ["happy_dancing", "yay"]
+    WORKING_HARD_KEYWORDS = ["cat_typing"]
+
+    def __init__(self, catalog: Optional[GifCatalog] = None):
+        self.catalog = catalog or GifCatalog.get()
+        self.catalog.prefetch(self.GREETING_KEYWORDS + self.CELEBRATION_KEYWORDS + self.WORKING_HARD_KEYWORDS)
+
+    def get_random_gif(self, keyword: str) -> str:
+        """Get a random GIF for a keyword from the cached Giphy results."""
+        return self.catalog.pick(keyword)
 
     def get_celebration_gif(self) -> str:
         """Get a random celebration GIF."""
-        return self.get_random_gif(random.choice(["happy_dancing", "yay"]))
+        return self.get_random_gif(random.choice(self.CELEBRATION_KEYWORDS))
 
     def get_greeting_gif(self) -> str:
         """Get a random celebration GIF."""
-        return self.get_random_gif("hello there")
+        return self.get_random_gif(random.choice(self.GREETING_KEYWORDS))
 
     def get_working_hard_gif(self) -> str:
         """Get a random celebration GIF."""
-        return self.get_random_gif(random.choice(["cat_typing"]))
+        return self.get_random_gif(random.choice(self.WORKING_HARD_KEYWORDS))
@@ -1,5 +1,5 @@
 import os
-from typing import TypedDict, Annotated, Sequence, Dict
+from typing import TypedDict, Annotated, Sequence, Dict, Iterator, Optional
 import json
 
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
@@ -7,11 +7,15 @@ from dotenv import load_dotenv
 
 from langfuse import observe, get_client
 from connection.azure_client import AzureClient
+from conversation_memory import ConversationMemory, llm_summarizer
+from stream_parser import JsonFieldStreamer
 
 load_dotenv()
 
 
+# Sampled chat replies are never cached, only deterministic calls such as the summaries are
 client = AzureClient(chat_completion_model="gpt-4o-mini")
+memory = ConversationMemory(summarizer=llm_summarizer(client))
 
 # Define the state schema
 class AgentState(TypedDict):
@@ -19,16 +23,11 @@ class AgentState(TypedDict):
     customer_info: Annotated[dict, "Customer information extracted from conversation"]
     wants_to_signup: Annotated[bool, "Would the customer like to signup?"]
     session_id: Annotated[str, "id of the session"]
+    memory: Annotated[dict, "Rolling summary of the turns no longer sent verbatim"]
 
 
-@observe
-def property_agent(state: AgentState) -> Dict:
-    """Agent that handles property search conversations."""
-    langfuse = get_client()
-
-    # Add to the current trace
-    langfuse.update_current_trace(session_id=state["session_id"])
-
+def _build_messages(state: AgentState) -> list:
+    """Build the system prompt and chat history sent to the LLM."""
     messages = state["messages"]
     system_prompt = f"""
     You are an AI assistant for a startup called Uchi. You are here to helping customers find properties to buy. 
@@ -78,48 +77,118 @@ def property_agent(state: AgentState) -> Dict:
     Customer information: {state['customer_info']}
     Are they interested in signing up yet? {state['wants_to_signup']}
     """
-    formatted_messages = [
-        {"role": "system", "content": system_prompt}
-    ]
-    for msg in messages:
-        role = "user" if isinstance(msg, HumanMessage) else "assistant"
-        formatted_messages.append({"role": role, "content": msg["content"]})
+    memory_state = state.get("memory")
+    if memory_state is None:
+        memory_state = ConversationMemory.new_state()
+    return memory.build_messages(system_prompt, messages, memory_state)
+
+
+def _to_agent_result(parsed_response: Dict) -> Dict:
+    return {
+        "response": parsed_response["response"].replace("\n", "<br>"),
+        "customer_info": parsed_response["extracted_info"],
+        "wants_to_signup": parsed_response["wants_to_signup"],
+        "info_extracted": True,
+    }
+
+
+@observe
+def property_agent(state: AgentState) -> Dict:
+    """Agent that handles property search conversations."""
+    langfuse = get_client()
+
+    # Add to the current trace
+    langfuse.update_current_trace(session_id=state["session_id"])
 
     # Generate response
-    response = client.get_chat_completion(formatted_messages)
+    response = client.get_chat_completion(_build_messages(state))
     langfuse.update_current_trace(
         session_id=state["session_id"],
     )
     try:
         # Parse the response as JSON
         parsed_response = json.loads(response['content'])
-        return {
-            "response": parsed_response["response"].replace("\n", "<br>"),
-            "customer_info": parsed_response["extracted_info"],
-            "wants_to_signup": parsed_response["wants_to_signup"],
-        }
+        return _to_agent_result(parsed_response)
     except json.JSONDecodeError:
         return {
             "response": response["content"],
-            "customer_info": state.get("customer_info", {})
+            "customer_info": state.get("customer_info", {}),
+            "info_extracted": False,
         }
 
+
+class StreamedAgentResponse:
+    """
+    Iterable over the text of the agent's "response" field as it is generated.
+
+    Pass it to st.write_stream; once it has been consumed, `result` holds the same dict
+    property_agent would have returned (response, customer_info, wants_to_signup).
+    """
+
+    def __init__(self, state: AgentState):
+        self.state = state
+        self.result: Optional[Dict] = None
+
+    def __iter__(self) -> Iterator[str]:
+        return self._stream()
+
+    @observe(name="property_agent_stream")
+    def _stream(self) -> Iterator[str]:
+        langfuse = get_client()
+        langfuse.update_current_trace(session_id=self.state["session_id"])
+
+        parser = JsonFieldStreamer(field="response")
+        for chunk in client.stream_chat_completion(_build_messages(self.state)):
+            text = parser.feed(chunk)
+            if text:
+                yield text
+
+        parsed_response = parser.finish()
+        if parsed_response is not None and {"response", "extracted_info", "wants_to_signup"} <= parsed_response.keys():
+            self.result = _to_agent_result(parsed_response)
+        else:
+            self.result = {
+                "response": parser.text or parser.buffer,
+                "customer_info": self.state.get("customer_info", {}),
+                "info_extracted": False,
+            }
+
 def get_response(
         messages: Sequence[BaseMessage],
         customer_info: Dict = {},
         wants_to_signup: bool = None,
-        session_id: str = None
+        session_id: str = None,
+        memory_state: Dict = None,
 ) -> Dict:
     """Get a response from the agent for the given messages."""
     state = AgentState(
         messages=messages,
         customer_info=customer_info,
         wants_to_signup=wants_to_signup,
-        session_id=session_id
+        session_id=session_id,
+        memory=memory_state,
     )
     return property_agent(state)
 
 
+def get_response_stream(
+        messages: Sequence[BaseMessage],
+        customer_info: Dict = {},
+        wants_to_signup: bool = None,
+        session_id: str = None,
+        memory_state: Dict = None,
+) -> StreamedAgentResponse:
+    """Like get_response, but streams the reply text token by token."""
+    state = AgentState(
+        messages=messages,
+        customer_info=customer_info,
+        wants_to_signup=wants_to_signup,
+        session_id=session_id,
+        memory=memory_state,
+    )
+    return StreamedAgentResponse(state)
+
+
 # Have another agent to extract all the fields from the conversation into a structure format?
 if __name__ == "__main__":
     messages = [
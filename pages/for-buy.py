@@ -2,10 +2,9 @@ import time
 import uuid
 import streamlit as st
 
-from customer_info_processor import CustomerInfoProcessor, CustomerInfo
-from gif_service import GifService
-from connection.firestore import FireStore
-from submission_processor import RecommendationProcessor
+from conversation_memory import ConversationMemory
+from customer_info_processor import CustomerInfo
+from resources import get_firestore, get_gif_service, get_info_processor
 from ui_components.buyer_chat import run_chat
 from ui_components.buyer_survey import run_buyer_survey
 from utils import is_strong_password
@@ -18,20 +17,24 @@ def initialize_session_state():
         print(st.session_state["session_id"])
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    if "conversation_memory" not in st.session_state:
+        st.session_state.conversation_memory = ConversationMemory.new_state()
     if "customer_info" not in st.session_state:
         st.session_state.customer_info = {}
+    if "extracted_upto" not in st.session_state:
+        st.session_state.extracted_upto = 0
     if "wants_to_signup" not in st.session_state:
         st.session_state.wants_to_signup = False
     if "info_processor" not in st.session_state:
-        st.session_state.info_processor = CustomerInfoProcessor()
+        st.session_state.info_processor = get_info_processor()
     if "gif_service" not in st.session_state:
-        st.session_state.gif_service = GifService()
+        st.session_state.gif_service = get_gif_service()
     if "form_submitted" not in st.session_state:
         st.session_state.form_submitted = False
     if "form_results" not in st.session_state:
         st.session_state.form_results = {}
-    if "submission_processor" not in st.session_state:
-        st.session_state.recommendation_processor = RecommendationProcessor()
+    # Built on the first page load so the Firestore channel is warm by the time the form is submitted
+    get_firestore()
 
 
 
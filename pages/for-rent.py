@@ -4,8 +4,8 @@ from datetime import datetime
 
 import streamlit as st
 import streamlit_survey as ss
-from connection.firestore import FireStore
-from submission_processor import RecommendationProcessor
+from resources import get_firestore, get_recommendation_processor
+from submit_pipeline import run_submit_pipeline
 from utils import is_strong_password, convert_date_to_datetime
 
 
@@ -15,8 +15,8 @@ def initialize_session_state():
         st.session_state["session_id"] = str(uuid.uuid4())
     if "form_results" not in st.session_state:
         st.session_state.form_results = {}
-    if "recommendation_processor" not in st.session_state:
-        st.session_state.recommendation_processor = RecommendationProcessor()
+    # Built on the first page load so the Firestore channel is warm by the time the form is submitted
+    get_firestore()
 
 
 SUPPORTED_METADATA_TAGS = [
@@ -45,16 +45,15 @@ def run_rental_survey():
     pages = survey.pages(3, progress_bar=True, on_submit=lambda: on_submit())
 
     def on_submit():
-        # Save to Firestore
-        firestore = FireStore(credential_info=st.secrets["firestore_credentials"])
         submission_data = st.session_state.form_results.copy()
         submission_data["listing_type"] = "rent"
-        submission_id = firestore.insert_submission(submission_data)
+        # Saves to Firestore and starts the recommendation search, overlapping the GIF pick with the write
+        pipeline = run_submit_pipeline(get_firestore(), get_recommendation_processor("rent"), submission_data)
         
         # Show immediate feedback
         st.success("Submitted!")
 
-        st.session_state.recommendation_processor.submit_and_wait(submission_id)
+        st.session_state.recommendation_job_id = pipeline.results["recommendation"]
 
     with pages:
         if pages.current == 0:
@@ -188,6 +187,9 @@ def run_rental_survey():
                 "password": password if not password_error else None
             })
 
+    if st.session_state.get("recommendation_job_id"):
+        get_recommendation_processor("rent").render_job(st.session_state.recommendation_job_id)
+
 
 def main():
     # Hide sidebar completely with CSS
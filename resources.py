@@ -0,0 +1,42 @@
+import streamlit as st
+
+from connection.email_outbox import EmailOutbox
+from connection.firestore import FireStore
+from customer_info_processor import CustomerInfoProcessor
+from gif_service import GifService
+from submission_processor import RecommendationProcessor
+
+
+# Process-wide service objects shared by every browser session. None of them keep per-user
+# state, so one instance each (built once, under st.cache_resource's lock) is enough.
+
+@st.cache_resource
+def get_info_processor() -> CustomerInfoProcessor:
+    return CustomerInfoProcessor()
+
+
+@st.cache_resource
+def get_gif_service() -> GifService:
+    return GifService()
+
+
+@st.cache_resource
+def get_recommendation_processor(listing_type: str = "sale") -> RecommendationProcessor:
+    return RecommendationProcessor(listing_type=listing_type)
+
+
+@st.cache_resource
+def get_firestore() -> FireStore:
+    # Parses the service account once and opens the gRPC channel up front,
+    # so a submit only pays for its write RPC
+    firestore = FireStore(credential_info=st.secrets["firestore_credentials"])
+    firestore.warm_up()
+    return firestore
+
+
+@st.cache_resource
+def get_email_outbox() -> EmailOutbox:
+    outbox = EmailOutbox()
+    # Picks up emails left queued by a previous run
+    outbox.start()
+    return outbox
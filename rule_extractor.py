@@ -0,0 +1,246 @@
+import re
+from typing import Dict, List, NamedTuple, Optional
+
+
+class FieldMatch(NamedTuple):
+    value: object
+    confidence: float
+
+
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "eighteen": 18,
+}
+_NUMBER = r"(\d+|" + "|".join(NUMBER_WORDS) + r")"
+
+EMAIL_PATTERN = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
+PHONE_PATTERN = re.compile(r"(?:\+44\s?7\d{3}|\b07\d{3})\s?\d{3}\s?\d{3}\b")
+NAME_PATTERNS = [
+    (re.compile(r"\bmy name(?: is|'s)\s+([a-z][a-z'-]+)", re.IGNORECASE), 0.95),
+    # An introduction opening a sentence (or following a greeting), not a question. Only the name
+    # itself has to be capitalised, people type "i'm" as often as "I'm"
+    (re.compile(
+        r"(?:^|[.!?]\s+|\b(?i:hi|hello|hey)\b\W*)(?i:i am|i'm|im|call me|this is)\s+([A-Z][a-z'-]+)\b(?!\s*\?)"
+    ), 0.6),
+]
+NOT_NAMES = {"Looking", "Buying", "Interested", "Not", "Just", "Also", "Here", "Happy", "Thinking", "Searching"}
+# "I am British" describes rather than introduces
+DEMONYMS = {
+    "British", "English", "Scottish", "Welsh", "Irish", "European", "French", "German", "Spanish", "Italian",
+    "Portuguese", "Dutch", "Polish", "Greek", "Turkish", "Russian", "Ukrainian", "Romanian", "Swedish",
+    "American", "Canadian", "Australian", "Indian", "Pakistani", "Bangladeshi", "Chinese", "Japanese",
+    "Korean", "Asian", "African", "Nigerian", "Brazilian", "Londoner", "Local",
+}
+
+# Money amounts like "£450k", "450,000", "£1.2m", "500 thousand"
+MONEY_PATTERN = re.compile(
+    r"(£)?\s?(\d{1,3}(?:,\d{3})+|\d+(?:\.\d+)?)\s*(k|m|mil|million|thousand|grand)?\b",
+    re.IGNORECASE,
+)
+# An amount only counts as the budget in a message about buying or spending, and not when it
+# is what the user earns or has saved, e.g. "I earn 60k"
+BUDGET_CONTEXT = re.compile(
+    r"\b(budget|afford|up to|max(?:imum)?|spend|under|below|around|price|buy|buying|purchase|looking for|pay)\b",
+    re.IGNORECASE,
+)
+NOT_BUDGET_CONTEXT = re.compile(
+    r"\b(?:earn(?:s|ing)?|make|salary|income|deposit|savings|saved|paid|rent)\W+(?:\w+\W+){0,3}?$", re.IGNORECASE
+)
+NOT_BUDGET_SUFFIX = re.compile(r"\s*(?:deposit|salary|income|savings|a year|per year|per annum|pa)\b", re.IGNORECASE)
+BEDROOM_PATTERN = re.compile(_NUMBER + r"[\s-]*(?:bed(?:room)?s?|br)\b", re.IGNORECASE)
+MONTHS_PATTERN = re.compile(r"\b(?:in|within|next)\s+(?:the\s+)?(?:next\s+)?" + _NUMBER + r"\s*(month|year)s?\b", re.IGNORECASE)
+SOON_PATTERN = re.compile(r"\b(asap|as soon as possible|immediately|right away|this year)\b", re.IGNORECASE)
+NEXT_YEAR_PATTERN = re.compile(r"\bnext year\b", re.IGNORECASE)
+# Vague phrases like "not sure" or "alone" only count next to what they are about, so that
+# "not sure about the location" or "leave me alone" don't fill a required field
+TIMING_CONTEXT = r"(?:when|timeline|timing|timeframe|time ?scale|move|moving|buy|buying|purchase)"
+BUYING_CONTEXT = r"(?:buy|buying|purchas(?:e|ing)|mortgage|applying|application)"
+
+
+def _near(phrase: str, context: str, words: int = 4) -> re.Pattern:
+    """Pattern for `phrase` with `context` at most `words` words before or after it."""
+    gap = r"\W+(?:\w+\W+){0,%d}?" % words
+    return re.compile(rf"\b{phrase}{gap}{context}\b|\b{context}{gap}{phrase}\b", re.IGNORECASE)
+
+
+UNSURE_PATTERN = _near(r"(?:not sure|no rush|don'?t know|unsure|no idea|flexible)", TIMING_CONTEXT)
+_APARTMENTS = r"flats?|apartments?|maisonettes?|penthouses?|studios?"
+_HOUSES = r"houses?|detached|semi|terraced?|bungalows?|cottages?|townhouses?"
+APARTMENT_PATTERN = re.compile(rf"\b({_APARTMENTS})\b", re.IGNORECASE)
+HOUSE_PATTERN = re.compile(rf"\b({_HOUSES})\b", re.IGNORECASE)
+# The home the user has now ("I own my house", "selling our flat"), not the one they want
+CURRENT_HOME_PATTERN = re.compile(
+    rf"\b(?:own|owned|sell|selling|sold|live in|living in)\s+(?:my|our|a|the)\s+(?:current\s+)?"
+    rf"(?:[\w-]+\s+){{0,2}}?(?:{_APARTMENTS}|{_HOUSES}|home|place)\b",
+    re.IGNORECASE,
+)
+EITHER_PATTERN = re.compile(r"\b(either|both|open to both|any type)\b", re.IGNORECASE)
+FIRST_TIME_PATTERN = re.compile(r"\b(first[\s-]time buyers?|first[\s-]time buying|buying for the first time|never owned)\b", re.IGNORECASE)
+NOT_FIRST_TIME_PATTERN = re.compile(
+    r"\b(not (?:a |my )?first[\s-]time|(?:sold|selling|own) (?:my|our) (?:current )?(?:home|flat|house|place)|already own|second home|moving up)\b",
+    re.IGNORECASE,
+)
+ALONE_PATTERN = re.compile(
+    r"\bsingle buyer\b|" + _near(r"(?:on my own|by myself|just me|alone|solo)", BUYING_CONTEXT).pattern,
+    re.IGNORECASE,
+)
+TOGETHER_PATTERN = re.compile(
+    r"\bwith (?:my |a )?(partner|wife|husband|girlfriend|boyfriend|fianc[eé]e?|spouse|friend|family|parents|brother|sister)\b|\bjoint(?:ly)?\b",
+    re.IGNORECASE,
+)
+
+
+def _number(token: str) -> Optional[int]:
+    token = token.lower()
+    if token.isdigit():
+        return int(token)
+    return NUMBER_WORDS.get(token)
+
+
+class RuleBasedExtractor:
+    """
+    Local, deterministic extraction of the structured CustomerInfo fields from a single message.
+
+    Patterns are compiled once at import, so running this on every chat message costs
+    microseconds. Each field comes with a confidence score; free-text fields such as
+    motivation and additional_notes are left to the LLM.
+    """
+
+    RULE_FIELDS = [
+        "first_name", "email", "phone", "maximum_budget", "number_of_rooms", "timeline",
+        "property_type", "is_first_time_buyer", "is_buying_alone",
+    ]
+
+    def extract(self, text: str) -> Dict[str, FieldMatch]:
+        """Return the fields found in text, keyed by CustomerInfo field name."""
+        matches = {}
+        for field in self.RULE_FIELDS:
+            match = getattr(self, f"_extract_{field}")(text)
+            if match is not None:
+                matches[field] = match
+        return matches
+
+    def extract_messages(self, messages: List[Dict]) -> Dict[str, FieldMatch]:
+        """Run over the user's messages in order, later mentions override earlier ones."""
+        matches = {}
+        for msg in messages:
+            if msg.get("role") == "user":
+                matches.update(self.extract(str(msg["content"])))
+        return matches
+
+    def _extract_first_name(self, text: str) -> Optional[FieldMatch]:
+        for pattern, confidence in NAME_PATTERNS:
+            found = pattern.search(text)
+            if found:
+                name = found.group(1).capitalize()
+                # Gerunds, as in "I am Living in London"
+                if name in NOT_NAMES or name in DEMONYMS or (len(name) > 4 and name.endswith("ing")):
+                    continue
+                return FieldMatch(name, confidence)
+        return None
+
+    def _extract_email(self, text: str) -> Optional[FieldMatch]:
+        found = EMAIL_PATTERN.search(text)
+        return FieldMatch(found.group(0).lower(), 0.99) if found else None
+
+    def _extract_phone(self, text: str) -> Optional[FieldMatch]:
+        found = PHONE_PATTERN.search(text)
+        return FieldMatch(re.sub(r"\s", "", found.group(0)), 0.9) if found else None
+
+    def _extract_maximum_budget(self, text: str) -> Optional[FieldMatch]:
+        """Budget in thousands of GBP; with a range the upper bound is the maximum."""
+        amounts = []
+        text = PHONE_PATTERN.sub(" ", EMAIL_PATTERN.sub(" ", text))
+        if not BUDGET_CONTEXT.search(text):
+            return None
+        for found in MONEY_PATTERN.finditer(text):
+            if NOT_BUDGET_CONTEXT.search(text, 0, found.start()) or NOT_BUDGET_SUFFIX.match(text, found.end()):
+                continue
+            pound, number, unit = found.groups()
+            value = float(number.replace(",", ""))
+            unit = (unit or "").lower()
+            if unit in ("m", "mil", "million"):
+                value *= 1000
+            elif unit in ("k", "thousand", "grand"):
+                pass
+            elif value >= 10000:
+                value /= 1000
+            elif not pound:
+                # A bare small number is more likely bedrooms or months than a budget
+                continue
+            if 50 <= value <= 20000:
+                amounts.append(int(value))
+        return FieldMatch(max(amounts), 0.9) if amounts else None
+
+    def _extract_number_of_rooms(self, text: str) -> Optional[FieldMatch]:
+        found = BEDROOM_PATTERN.search(text)
+        if found:
+            rooms = _number(found.group(1))
+            if rooms is not None and rooms <= 10:
+                return FieldMatch(rooms, 0.95)
+        return None
+
+    def _extract_timeline(self, text: str) -> Optional[FieldMatch]:
+        found = MONTHS_PATTERN.search(text)
+        if found:
+            months = _number(found.group(1))
+            if months is not None:
+                if found.group(2).lower() == "year":
+                    months *= 12
+                if months <= 6:
+                    return FieldMatch("in 6 months", 0.85)
+                if months <= 12:
+                    return FieldMatch("in 12 months", 0.85)
+                return FieldMatch("not sure", 0.6)
+        if UNSURE_PATTERN.search(text):
+            return FieldMatch("not sure", 0.7)
+        if SOON_PATTERN.search(text):
+            return FieldMatch("in 6 months", 0.7)
+        if NEXT_YEAR_PATTERN.search(text):
+            return FieldMatch("in 12 months", 0.6)
+        return None
+
+    def _extract_property_type(self, text: str) -> Optional[FieldMatch]:
+        text = CURRENT_HOME_PATTERN.sub(" ", text)
+        apartment = APARTMENT_PATTERN.search(text)
+        house = HOUSE_PATTERN.search(text)
+        if (apartment and house) or ((apartment or house) and EITHER_PATTERN.search(text)):
+            return FieldMatch("both", 0.8)
+        if apartment:
+            return FieldMatch("apartment", 0.8)
+        if house:
+            return FieldMatch("house", 0.8)
+        return None
+
+    def _extract_is_first_time_buyer(self, text: str) -> Optional[FieldMatch]:
+        if NOT_FIRST_TIME_PATTERN.search(text):
+            return FieldMatch(False, 0.85)
+        if FIRST_TIME_PATTERN.search(text):
+            return FieldMatch(True, 0.9)
+        return None
+
+    def _extract_is_buying_alone(self, text: str) -> Optional[FieldMatch]:
+        if TOGETHER_PATTERN.search(text):
+            return FieldMatch(False, 0.8)
+        if ALONE_PATTERN.search(text):
+            return FieldMatch(True, 0.8)
+        return None
+
+
+def merge_rule_matches(
+    customer_info: Optional[dict],
+    matches: Dict[str, FieldMatch],
+    override_confidence: float = 0.9,
+    min_confidence: float = 0.5,
+) -> dict:
+    """
+    Merge rule matches into customer info. Confident matches override what is there,
+    weaker ones only fill gaps.
+    """
+    merged = dict(customer_info or {})
+    for field, match in matches.items():
+        if match.confidence < min_confidence:
+            continue
+        if merged.get(field) is None or match.confidence >= override_confidence:
+            merged[field] = match.value
+    return merged
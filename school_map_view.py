@@ -1,53 +1,87 @@
+import html
+from typing import Tuple
+
 import streamlit as st
+import streamlit.components.v1 as components
 import folium
-from streamlit_folium import st_folium
+from folium.plugins import FastMarkerCluster
 
-# TODO: This is a teaser sample
-def school_map_view():
-    locations = [
-        {"name": "Primary school 1", "lat": 51.5007, "lon": -0.1246, "school": True, "info": "Primary school 1 in Fincheley, state, outstanding ⭐"},
-        {"name": "Property 2", "lat": 51.5081, "lon": -0.0759, "school": False, "info": "£700000, 4 bedrooms"},
-        {"name": "Primary school 2", "lat": 51.5971, "lon": -0.1981, "school": True, "info": "Primary school 2, independent"},
-        {"name": "Primary school 3", "lat": 52.0020, "lon": -0.36, "school": True, "info": "Primary school 3, state, good"},
-        {"name": "Property 2", "lat": 51.5101, "lon": -0.0259, "school": False, "info": "£700000, 4 bedrooms"},
-        {"name": "Primary school 4", "lat": 51.4973, "lon": 0.1295, "school": True, "info": "Primary school 4, state, good"},
-        {"name": "Primary school 5", "lat": 51.5007, "lon": -0.1246, "school": True,
-         "info": "Primary school 1, state, outstanding ⭐"},
-        {"name": "Property 2", "lat": 51.5571, "lon": 0.2860, "school": False, "info": "£700000, 4 bedrooms"},
-        {"name": "Primary school 6", "lat": 51.4282, "lon": 0.1669, "school": True, "info": "Primary school 5, independent"},
-        {"name": "Primary school 7", "lat": 51.4876, "lon": -0.2672, "school": True,
-         "info": "Primary school 1, state, outstanding ⭐"},
-        {"name": "Property 1", "lat": 51.5377, "lon": 0.0761, "school": True, "info": "Primary school 6, state, outstanding ⭐"},
-        {"name": "Property 2", "lat": 51.2101, "lon": -0.00, "school": False, "info": "£700000, 4 bedrooms"},
-        {"name": "Property in Marylebone", "lat": 51.5189, "lon": -0.1499, "school": False, "info": "£500000, 2 bedrooms"},
-        {"name": "Property in Highgate", "lat": 51.5717, "lon": -0.00, "school": False, "info": "£650000, 3 bedrooms"},
-        {"name": "Property in Walthamstow", "lat": 51.5902, "lon": 0.0173, "school": False, "info": "£700000, 2 bedrooms"},
-        {"name": "Property in Forest Gate", "lat": 51.5439, "lon": -0.0264, "school": False, "info": "£280000, 1 bedrooms"},
-        {"name": "Property in Brixton", "lat": 51.4613, "lon": -0.1156, "school": False,
-         "info": "£300000, 2 bedrooms"},
-    ]
+from geo import load_points
+
+
+# Builds each marker in the browser from a compact [lat, lon, tooltip, popup] row, so the page
+# carries a JSON array instead of a block of JavaScript per marker
+MARKER_CALLBACK = """
+function (row) {
+    var icon = L.AwesomeMarkers.icon({icon: '%s', prefix: 'fa', markerColor: '%s'});
+    var marker = L.marker(new L.LatLng(row[0], row[1]), {icon: icon});
+    marker.bindTooltip(row[2]);
+    marker.bindPopup(row[3]);
+    return marker;
+};
+"""
+
+CLUSTER_OPTIONS = {
+    # Clusters split up as the user zooms in, and every marker shows individually at street level
+    "maxClusterRadius": 60,
+    "disableClusteringAtZoom": 15,
+    "spiderfyOnMaxZoom": False,
+    "chunkedLoading": True,
+}
+
+
+def _marker_rows(points, mask):
+    rows = zip(
+        points.lat[mask].round(5).tolist(),
+        points.lon[mask].round(5).tolist(),
+        points["name"][mask].tolist(),
+        points["info"][mask].tolist(),
+    )
+    return [[lat, lon, html.escape(name), html.escape(info)] for lat, lon, name, info in rows]
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def render_map_html(schools_version: str, properties_version: str, ratings: Tuple[str, ...], show_properties: bool) -> str:
+    """
+    Map HTML for the given filters. The dataset versions are part of the cache key, so reruns
+    with the same filters reuse the HTML and an updated CSV renders a fresh map.
+    """
+    schools = load_points("schools")
+    properties = load_points("properties")
 
     # Create Folium map centered around London
     m = folium.Map(location=[51.5074, -0.1278], zoom_start=11)
 
-    # Add markers
-    for loc in locations:
-        if loc["school"]:
-            icon = folium.Icon(color="red", icon="school", prefix="fa")
-        else:
-            icon = folium.Icon(color="blue", icon="house", prefix="fa")
-
-        folium.Marker(
-            location=[loc["lat"], loc["lon"]],
-            tooltip=loc["name"],
-            popup=loc["info"],
-            icon=icon
+    school_mask = schools.mask(phase="primary", rating=list(ratings))
+    FastMarkerCluster(
+        _marker_rows(schools, school_mask),
+        callback=MARKER_CALLBACK % ("school", "red"),
+        options=CLUSTER_OPTIONS,
+        name=f"Primary schools ({int(school_mask.sum())})",
+    ).add_to(m)
+    if show_properties:
+        FastMarkerCluster(
+            _marker_rows(properties, slice(None)),
+            callback=MARKER_CALLBACK % ("house", "blue"),
+            options=CLUSTER_OPTIONS,
+            name=f"Properties ({len(properties)})",
         ).add_to(m)
+    folium.LayerControl(collapsed=True).add_to(m)
+    return m.get_root().render()
+
+
+def school_map_view():
+    schools = load_points("schools")
+    properties = load_points("properties")
 
     # Display map in Streamlit
     st.title("Schools & Properties Map")
     st.markdown("Displaying all the good & outstanding Primary schools in London")
-    st_data = st_folium(m, width=700, height=500)
+    ratings = st.multiselect("Ofsted rating", ["outstanding", "good"], default=["outstanding", "good"])
+    show_properties = st.checkbox("Show properties", value=True)
+
+    map_html = render_map_html(schools.version, properties.version, tuple(sorted(ratings)), show_properties)
+    components.html(map_html, width=700, height=500)
 
 if __name__ == '__main__':
-    school_map_view()
\ No newline at end of file
+    school_map_view()
@@ -0,0 +1,148 @@
+import json
+from typing import Optional, Dict, Any
+
+
+_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+class JsonFieldStreamer:
+    """
+    Incrementally pulls one top-level string field out of a JSON object while it is being streamed.
+
+    Feed it raw chunks from the LLM; each call to feed() returns the newly decoded characters
+    of the target field, so they can be rendered straight away. Once the stream is done,
+    finish() parses the whole buffer so the remaining fields (e.g. extracted_info) can be read.
+
+    If the model ignores the JSON instructions and answers in plain text, the text is passed
+    through unchanged.
+    """
+
+    def __init__(self, field: str = "response"):
+        self.field = field
+        self.buffer = ""
+        self.text = ""  # decoded value of the target field so far
+
+        self._plain_text = None  # decided on the first non-whitespace character
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._unicode = None  # hex digits of a \\uXXXX escape being read
+        self._high_surrogate = None
+        self._is_key = False
+        self._expect_key = False
+        self._after_colon = False
+        self._key_buffer = ""
+        self._last_key = None
+        self._capturing = False
+
+    def feed(self, chunk: str) -> str:
+        """Consume a raw chunk, returning any new characters of the target field."""
+        self.buffer += chunk
+        out = []
+        for char in chunk:
+            if self._plain_text is None:
+                if char.isspace():
+                    continue
+                # Models sometimes wrap the object in ```json fences
+                self._plain_text = char not in "{`"
+            if self._plain_text:
+                out.append(char)
+            else:
+                decoded = self._consume(char)
+                if decoded:
+                    out.append(decoded)
+
+        new_text = "".join(out)
+        self.text += new_text
+        return new_text
+
+    def finish(self) -> Optional[Dict[str, Any]]:
+        """Parse the complete buffer, returning None if it is not a JSON object."""
+        if self._plain_text:
+            return None
+        content = self.buffer.strip()
+        if content.startswith("```"):
+            content = content.strip("`")
+            if content.startswith("json"):
+                content = content[len("json"):]
+        try:
+            parsed = json.loads(content)
+        except json.JSONDecodeError:
+            return None
+        return parsed if isinstance(parsed, dict) else None
+
+    def _consume(self, char: str) -> str:
+        if self._in_string:
+            return self._consume_string_char(char)
+
+        if char in "{[":
+            self._depth += 1
+            self._expect_key = char == "{" and self._depth == 1
+            self._after_colon = False
+        elif char in "}]":
+            self._depth -= 1
+        elif char == "," and self._depth == 1:
+            self._expect_key = True
+            self._after_colon = False
+        elif char == ":" and self._depth == 1:
+            self._expect_key = False
+            self._after_colon = True
+        elif char == '"':
+            self._in_string = True
+            self._is_key = self._depth == 1 and self._expect_key
+            self._key_buffer = ""
+            self._capturing = (
+                self._depth == 1 and self._after_colon and self._last_key == self.field
+            )
+        return ""
+
+    def _consume_string_char(self, char: str) -> str:
+        decoded = ""
+        if self._unicode is not None:
+            self._unicode += char
+            if len(self._unicode) < 4:
+                return ""
+            decoded = self._decode_unicode(int(self._unicode, 16))
+            self._unicode = None
+        elif self._escape:
+            self._escape = False
+            if char == "u":
+                self._unicode = ""
+                return ""
+            decoded = _ESCAPES.get(char, char)
+        elif char == "\\":
+            self._escape = True
+            return ""
+        elif char == '"':
+            self._in_string = False
+            if self._is_key:
+                self._last_key = self._key_buffer
+            self._capturing = False
+            self._after_colon = False
+            return ""
+        else:
+            decoded = char
+
+        if self._is_key:
+            self._key_buffer += decoded
+            return ""
+        return decoded if self._capturing else ""
+
+    def _decode_unicode(self, code: int) -> str:
+        # Characters outside the BMP (e.g. emojis) arrive as a surrogate pair of \\u escapes
+        if 0xD800 <= code <= 0xDBFF:
+            self._high_surrogate = code
+            return ""
+        if 0xDC00 <= code <= 0xDFFF and self._high_surrogate is not None:
+            code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+        self._high_surrogate = None
+        return chr(code)
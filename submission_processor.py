@@ -1,73 +1,352 @@
+import json
+import math
+
 import streamlit as st
 import requests
 import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
+from commute import get_commute_matrix
+from connection import http_session
+from connection.cache import LRUTTLCache, make_cache_key
 from gif_service import GifService
 
 
+@dataclass
+class RecommendationJob:
+    job_id: str
+    submission_id: str
+    status: str = "pending"  # pending -> running -> done | failed | handed_off
+    submitted_at: float = field(default_factory=time.monotonic)
+    finished_at: Optional[float] = None
+    result: Optional[List[Dict[str, Any]]] = None
+    error: Optional[str] = None
+    gif_url: Optional[str] = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.submitted_at
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("done", "failed", "handed_off")
+
+
+class RecommendationJobManager:
+    """
+    Runs recommendation requests on a shared background executor.
+
+    submit() returns a job id straight away; the page polls get() for progress. Finished
+    jobs are forgotten after `retention` seconds.
+    """
+
+    def __init__(self, max_workers: int = 8, retention: float = 3600):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="recommendation")
+        self.retention = retention
+        self._jobs: Dict[str, RecommendationJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, submission_id: str, work) -> RecommendationJob:
+        """Schedule work(job) in the background and return the job handle."""
+        job = RecommendationJob(job_id=str(uuid.uuid4()), submission_id=submission_id)
+        with self._lock:
+            self._evict()
+            self._jobs[job.job_id] = job
+
+        def run():
+            job.status = "running"
+            try:
+                work(job)
+            except Exception as e:
+                job.error = str(e)
+                job.status = "failed"
+            job.finished_at = time.monotonic()
+
+        self.executor.submit(run)
+        return job
+
+    def add_finished(self, submission_id: str, result: List[Dict[str, Any]]) -> RecommendationJob:
+        """Record a job whose results are already known, e.g. from the results cache."""
+        now = time.monotonic()
+        job = RecommendationJob(
+            job_id=str(uuid.uuid4()), submission_id=submission_id, status="done",
+            submitted_at=now, finished_at=now, result=result,
+        )
+        with self._lock:
+            self._evict()
+            self._jobs[job.job_id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[RecommendationJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _evict(self):
+        now = time.monotonic()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and now - job.finished_at > self.retention
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+# Form fields that identify the user rather than what they are looking for
+IDENTITY_FIELDS = {"first_name", "name", "email", "password", "session_id", "chat_session_id", "created_at"}
+
+
+# Free-text fields that hold a comma-separated list, where the order doesn't matter
+COMMA_SEPARATED_FIELDS = {"preferred_location"}
+
+
+def _normalize_preference(value, comma_separated: bool = False):
+    if isinstance(value, str):
+        text = " ".join(value.lower().split())
+        # "West London,Finsbury Park" and "finsbury park, west london" are the same search
+        if comma_separated:
+            return sorted(part.strip() for part in text.split(",") if part.strip())
+        return text
+    if isinstance(value, (list, tuple, set)):
+        return sorted((_normalize_preference(v) for v in value), key=str)
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def preference_fingerprint(form_results: Dict[str, Any]) -> str:
+    """
+    Stable hash of the search preferences in a submitted form, ignoring name, email and password,
+    so a resubmission (e.g. after a password typo) maps to the same search.
+    """
+    preferences = {
+        key: _normalize_preference(value, comma_separated=key in COMMA_SEPARATED_FIELDS)
+        for key, value in form_results.items()
+        if key not in IDENTITY_FIELDS and value not in (None, "", [])
+    }
+    return make_cache_key("preferences", preferences)
+
+
 class RecommendationProcessor:
-    def __init__(self, listing_type: str = "sale"):
+    def __init__(self, listing_type: str = "sale", wait_window: float = 20, poll_interval: float = 1, results_ttl: float = 900):
         self.listing_type = listing_type
         self.url = st.secrets.get("CREATE_RECOMMENDATION_URL")
         self.git_service = GifService()
-    
-    def submit_and_wait(self, submission_id: str):
+        # How long the page keeps polling before handing off to the email follow-up
+        self.wait_window = wait_window
+        self.poll_interval = poll_interval
+        self.jobs = RecommendationJobManager()
+        # matched_properties of recent searches, keyed by preference_fingerprint
+        self.results_cache = LRUTTLCache(max_entries=1024, ttl=results_ttl)
+
+    def submit(self, submission_id: str, preferences: Optional[Dict[str, Any]] = None, gif_url: Optional[str] = None) -> str:
         """
-        Submit data to external API and display results when ready
+        Start the recommendation search in the background and return its job id immediately.
+        Render its progress with render_job, next to gif_url (a "working hard" GIF if omitted).
+
+        If preferences (the submitted form) are given and the same search ran recently, the
+        job is completed straight from the results cache, and the submission is sent to the
+        recommender in the background without waiting for its response.
         """
-        # Create placeholders for loading and results
-        loading_placeholder = st.empty()
-        results_placeholder = st.empty()
-        
-        # Show loading content
-        with loading_placeholder.container():
-            st.write("<h3>We are searching based on your preference ✨</h3>", unsafe_allow_html=True)
-            st.info("🔄 This may take up to 10 seconds.")
-            gif_url = self.git_service.get_working_hard_gif()
-            st.image(gif_url, width=400)
-        
-        # Make the request in a separate thread
-        result_container = {"result": None, "error": None}
-        
-        def make_request():  # Refine this pipeline
-            try:
-                payload = {
-                    "submission_id": submission_id,
-                    "days_added": 30,
-                }
-                
-                response = requests.post(
-                    self.url,
-                    json=payload,
-                    headers={'Content-Type': 'application/json'},
-                    timeout=20
-                )
-                
-                if response.status_code == 200:
-                    result_container["result"] = response.json().get("matched_properties")
+        fingerprint = preference_fingerprint(preferences) if preferences else None
+        if fingerprint:
+            cached = self.results_cache.get(fingerprint)
+            if cached is not None:
+                # The recommender still needs the new submission, just don't wait for it
+                self.jobs.executor.submit(self._register_submission, submission_id)
+                return self.jobs.add_finished(submission_id, cached).job_id
+
+        def work(job: RecommendationJob):
+            self._make_request(job)
+            if fingerprint and job.status == "done" and job.result is not None:
+                self.results_cache.set(fingerprint, job.result)
+
+        job = self.jobs.submit(submission_id, work)
+        job.gif_url = gif_url or self.git_service.get_working_hard_gif()
+        return job.job_id
+
+    def _post(self, submission_id: str, read_timeout: float):
+        return http_session.post(
+            self.url,
+            json={
+                "submission_id": submission_id,
+                "days_added": 30,
+            },
+            headers={
+                'Content-Type': 'application/json',
+                # Ask for matches one by one as they are scored, plain JSON is still accepted
+                'Accept': 'application/x-ndjson, text/event-stream;q=0.9, application/json;q=0.8',
+            },
+            timeout=(http_session.DEFAULT_TIMEOUT[0], read_timeout),
+            stream=True,
+        )
+
+    def _register_submission(self, submission_id: str):
+        """
+        Send a submission whose results came from the cache to the recommender anyway, so it
+        stores recommendations for it. Only the request matters, the response isn't read.
+        """
+        try:
+            with self._post(submission_id, http_session.DEFAULT_TIMEOUT[1]) as response:
+                if response.status_code != 200:
+                    print(f"Error registering submission {submission_id}: API error: {response.status_code}")
+        except requests.Timeout:
+            # The request is in, the search carries on server side
+            pass
+        except requests.ConnectionError as e:
+            print(f"Error registering submission {submission_id}: {str(e)}")
+
+    def _make_request(self, job: RecommendationJob):
+        try:
+            # Give up when the page stops waiting, the search itself carries on server side
+            response = self._post(job.submission_id, self.wait_window)
+            # A streamed response holds its pooled connection until closed, error or not
+            with response:
+                if response.status_code != 200:
+                    job.error = f"API error: {response.status_code}"
+                    job.status = "failed"
+                    return
+
+                content_type = response.headers.get("Content-Type", "")
+                if content_type.startswith(("application/x-ndjson", "application/jsonl", "text/event-stream")):
+                    job.result = []
+                    # The read timeout only bounds each read, a steady trickle of lines would
+                    # keep this worker busy long after the page has handed off
+                    deadline = job.submitted_at + self.wait_window
+                    for prop in self._iter_streamed_properties(response, deadline):
+                        # Appending is atomic, so the polling page can render what has arrived so far
+                        job.result.append(prop)
                 else:
-                    result_container["error"] = f"API error: {response.status_code}"
-                    
-            except Exception as e:
-                result_container["error"] = str(e)
+                    job.result = response.json().get("matched_properties")
+                job.status = "done"
 
-        thread = threading.Thread(target=make_request)
-        thread.start()
-        thread.join()  # Wait for completion
-        
-        # Clear the loading content (including GIF)
-        loading_placeholder.empty()
-        
-        # Display results
-        with results_placeholder.container():
-            if result_container["error"]:
-                st.markdown(f"Looks like the search might take a little bit longer - we will send an email when it's ready!")
+        except (requests.Timeout, requests.ConnectionError):
+            # Also covers a read timeout in the middle of a stream, partial results are kept
+            job.status = "handed_off"
+
+    @staticmethod
+    def _iter_streamed_properties(response, deadline: Optional[float] = None):
+        """
+        Yield matched properties from an NDJSON or SSE response body, raising requests.Timeout
+        once time.monotonic() passes the deadline.
+        """
+        # Without a charset in the Content-Type requests would hand back bytes
+        response.encoding = response.encoding or "utf-8"
+        for line in response.iter_lines(decode_unicode=True):
+            if deadline is not None and time.monotonic() > deadline:
+                raise requests.Timeout("Recommendation stream ran past the wait window")
+            if not line:
+                continue
+            if line.startswith("data:"):
+                line = line[len("data:"):].strip()
+                if line == "[DONE]":
+                    return
+            elif line.startswith((":", "event:", "id:", "retry:")):
+                continue
+            item = json.loads(line)
+            # Either one property per line or batches of {"matched_properties": [...]}
+            if isinstance(item, dict) and "matched_properties" in item:
+                yield from item["matched_properties"]
             else:
-                self._display_results(result_container.get("result"))
-    
-    def _display_results(self, data: List[Dict[str, Any]]):
+                yield item
+
+    def render_job(self, job_id: str):
+        """
+        Show the job's progress, polling with a fragment until it finishes or the wait window
+        runs out, then show the results or the "we will email you" message.
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        if self._is_settled(job):
+            self._render_finished(job)
+            return
+
+        @st.fragment(run_every=self.poll_interval)
+        def poll():
+            current = self.jobs.get(job_id)
+            if current is None or self._is_settled(current):
+                # Rerun the whole page so polling stops and the final state is rendered once
+                st.rerun()
+            self._render_pending(current)
+
+        poll()
+
+    def _is_settled(self, job: RecommendationJob) -> bool:
+        return job.is_finished or job.elapsed > self.wait_window
+
+    def _render_pending(self, job: RecommendationJob):
+        st.write("<h3>We are searching based on your preference ✨</h3>", unsafe_allow_html=True)
+        st.progress(min(job.elapsed / self.wait_window, 1.0))
+        if job.result:
+            st.markdown(f"<h5>🎉 {len(job.result)} matching properties found so far...</h5>", unsafe_allow_html=True)
+            self._display_property_cards(list(job.result), key=job.job_id)
+            return
+        st.info("🔄 This may take up to 10 seconds.")
+        if job.gif_url:
+            st.image(job.gif_url, width=400)
+
+    def _render_finished(self, job: RecommendationJob):
+        if job.status == "done" or job.result:
+            self._display_results(list(job.result or []), key=job.job_id)
+        if job.status != "done":
+            st.markdown(f"Looks like the search might take a little bit longer - we will send an email when it's ready!")
+
+    def _display_property_cards(self, properties: List[Dict[str, Any]], key: str, page_size: int = 5):
+        """Render one page of property cards, so long result lists stay cheap to draw."""
+        page_key = f"recommendation_page_{key}"
+        num_pages = (len(properties) + page_size - 1) // page_size
+        page = min(st.session_state.get(page_key, 0), num_pages - 1)
+
+        page_properties = properties[page * page_size:(page + 1) * page_size]
+        commutes = self._commute_minutes(page_properties)
+        for prop, commute_minutes in zip(page_properties, commutes):
+            with st.container(border=True):
+                title = prop.get("title") or prop.get("address") or prop.get("display_address") or "Property"
+                st.markdown(f"**{title}**")
+                details = []
+                if prop.get("price"):
+                    details.append(f"£{prop['price']:,}" if isinstance(prop["price"], (int, float)) else str(prop["price"]))
+                if prop.get("bedrooms") is not None:
+                    details.append(f"{prop['bedrooms']} bedrooms")
+                if prop.get("prop_property_criteria_matched"):
+                    details.append(f"match {prop['prop_property_criteria_matched']:.0%}")
+                if commute_minutes is not None:
+                    details.append(f"~{commute_minutes} min commute")
+                if details:
+                    st.caption(" · ".join(details))
+                if prop.get("matched_criteria"):
+                    st.markdown(" ".join(f"✅ {criterion}" for criterion in prop["matched_criteria"]))
+
+        if num_pages > 1:
+            previous_col, label_col, next_col = st.columns([1, 2, 1])
+            previous_col.button(
+                "← Previous", key=f"{page_key}_previous", disabled=page == 0,
+                on_click=st.session_state.__setitem__, args=(page_key, page - 1),
+            )
+            label_col.caption(f"Page {page + 1} of {num_pages}")
+            next_col.button(
+                "Next →", key=f"{page_key}_next", disabled=page >= num_pages - 1,
+                on_click=st.session_state.__setitem__, args=(page_key, page + 1),
+            )
+
+    @staticmethod
+    def _commute_minutes(properties: List[Dict[str, Any]]) -> List[Optional[int]]:
+        """Commute to the submitted workplace_location from the offline matrix, if it has been built."""
+        workplace = st.session_state.get("form_results", {}).get("workplace_location")
+        matrix = get_commute_matrix() if workplace else None
+        if matrix is None:
+            return [None] * len(properties)
+        minutes = matrix.commute_minutes([prop.get("postcode") or prop.get("outcode") for prop in properties], workplace)
+        return [None if math.isnan(m) else int(m) for m in minutes.tolist()]
+
+    def _display_results(self, data: List[Dict[str, Any]], key: str = "results"):
         """Display the API results"""
         
         # Handle the matched properties data structure
@@ -79,8 +358,8 @@ class RecommendationProcessor:
             # Show summary
             st.markdown(f"<h5>🎉Great news! We found {num_properties} properties that match your criteria</h5>", unsafe_allow_html=True)
             
-            # Get the first (best) property for the matched criteria display
-            best_property = properties[0]
+            # Streamed matches arrive in scoring order rather than best first
+            best_property = max(properties, key=lambda prop: prop.get("prop_property_criteria_matched") or 0)
             matched_criteria = best_property.get("matched_criteria", [])
             
             if matched_criteria:
@@ -96,6 +375,7 @@ class RecommendationProcessor:
             
             # Add some spacing
             st.write("")
+            self._display_property_cards(properties, key=key)
 
         else:
             st.markdown("<h5> We haven't found any suitable properties that got listed in the last 7 days. "
@@ -0,0 +1,165 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# Shared by every session's submits, the stages are short I/O waits
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="submit")
+
+
+@dataclass
+class StageTiming:
+    name: str
+    status: str = "pending"  # pending -> running -> done | failed | skipped
+    started_at: Optional[float] = None  # seconds since the graph started
+    finished_at: Optional[float] = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+
+class TaskGraph:
+    """
+    Runs a small DAG of stages on a thread pool, each one as soon as the stages it depends on
+    are done, so the total time is that of the longest dependency chain rather than the sum.
+
+    Each stage is called with the results of its dependencies, in order. If a required stage
+    fails, the stages depending on it are skipped and run() re-raises its error once everything
+    else has finished. An optional stage that fails passes None to its dependents instead.
+
+    Stage functions run on worker threads, so they mustn't use st.* (resolve st.secrets,
+    session state and cached resources beforehand and pass them in).
+    """
+
+    def __init__(self, executor: Optional[ThreadPoolExecutor] = None):
+        self.executor = executor or _executor
+        self._stages: Dict[str, Tuple[Callable, Tuple[str, ...], bool]] = {}
+        self.results: Dict[str, Any] = {}
+        self.errors: Dict[str, Exception] = {}
+        self.timings: Dict[str, StageTiming] = {}
+        self.total_seconds: Optional[float] = None
+
+    def add(self, name: str, fn: Callable, *depends_on: str, required: bool = True) -> "TaskGraph":
+        for dependency in depends_on:
+            if dependency not in self._stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dependency}")
+        self._stages[name] = (fn, depends_on, required)
+        self.timings[name] = StageTiming(name)
+        return self
+
+    def run(self) -> Dict[str, Any]:
+        start = time.perf_counter()
+        waiting = dict(self._stages)
+        running = {}
+
+        def launch_ready():
+            # Loops because skipping a stage can make its dependents ready straight away
+            launched = True
+            while launched:
+                launched = False
+                for name, (fn, depends_on, _) in list(waiting.items()):
+                    if not all(self._settled(dep) for dep in depends_on):
+                        continue
+                    del waiting[name]
+                    launched = True
+                    if any(self._blocks(dep) for dep in depends_on):
+                        self.timings[name].status = "skipped"
+                        continue
+                    args = [self.results.get(dep) for dep in depends_on]
+                    running[self.executor.submit(self._run_stage, name, fn, args, start)] = name
+
+        launch_ready()
+        while running:
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                del running[future]
+            launch_ready()
+        self.total_seconds = time.perf_counter() - start
+
+        for name, error in self.errors.items():
+            if self._stages[name][2]:
+                raise error
+        return self.results
+
+    def _settled(self, name: str) -> bool:
+        return self.timings[name].status in ("done", "failed", "skipped")
+
+    def _blocks(self, name: str) -> bool:
+        """Whether a settled stage keeps its dependents from running."""
+        status = self.timings[name].status
+        return status == "skipped" or (status == "failed" and self._stages[name][2])
+
+    def _run_stage(self, name: str, fn: Callable, args: List, start: float):
+        timing = self.timings[name]
+        timing.status = "running"
+        timing.started_at = time.perf_counter() - start
+        try:
+            self.results[name] = fn(*args)
+            timing.status = "done"
+        except Exception as e:
+            print(f"Error in stage {name}: {str(e)}")
+            self.errors[name] = e
+            timing.status = "failed"
+        timing.finished_at = time.perf_counter() - start
+
+    def critical_path(self) -> List[str]:
+        """The chain of stages that determined the total time, first to last."""
+        finished = [t for t in self.timings.values() if t.finished_at is not None]
+        if not finished:
+            return []
+        path = [max(finished, key=lambda t: t.finished_at).name]
+        while True:
+            dependencies = [self.timings[dep] for dep in self._stages[path[-1]][1]]
+            dependencies = [t for t in dependencies if t.finished_at is not None]
+            if not dependencies:
+                return path[::-1]
+            path.append(max(dependencies, key=lambda t: t.finished_at).name)
+
+    def summary(self) -> str:
+        stages = ", ".join(
+            f"{t.name} {t.duration * 1000:.0f}ms" if t.duration is not None else f"{t.name} {t.status}"
+            for t in self.timings.values()
+        )
+        total = f"{self.total_seconds * 1000:.0f}ms" if self.total_seconds is not None else "-"
+        return f"{stages}; total {total} via {' -> '.join(self.critical_path())}"
+
+
+def run_submit_pipeline(firestore, recommendation_processor, submission_data: Dict[str, Any],
+                        email_outbox=None) -> TaskGraph:
+    """
+    Submit flow of the survey pages. The Firestore write and the "working hard" GIF pick start
+    together. Once the write has returned the submission ID, the recommendation job starts and
+    the welcome email is queued side by side. The job ID is in graph.results["recommendation"].
+    """
+    graph = TaskGraph()
+    graph.add("firestore", lambda: firestore.insert_submission(submission_data))
+    graph.add("gif", recommendation_processor.git_service.get_working_hard_gif, required=False)
+    if email_outbox is not None:
+        graph.add(
+            "email",
+            # Only once the submission is saved, so a failed write sends no welcome email
+            lambda submission_id: email_outbox.enqueue_welcome_email(
+                submission_data.get("email"), submission_data.get("first_name")
+            ),
+            "firestore",
+            required=False,
+        )
+    graph.add(
+        "recommendation",
+        lambda submission_id, gif_url: recommendation_processor.submit(
+            submission_id, preferences=submission_data, gif_url=gif_url
+        ),
+        "firestore", "gif",
+    )
+    try:
+        graph.run()
+    finally:
+        logger.debug("Submit timings: %s", graph.summary())
+    return graph
@@ -0,0 +1,124 @@
+import itertools
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from connection.azure_client import AzureClient
+from connection.cache import LRUTTLCache
+from connection.rate_limiter import RateLimiter
+
+
+def _chunk(content=None, finish_reason=None, usage=None):
+    choices = [] if content is None and finish_reason is None else [
+        SimpleNamespace(delta=SimpleNamespace(content=content), finish_reason=finish_reason)
+    ]
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+class FakeStream:
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("AZURE_OPENAI_ENDPOINT", "https://example.openai.azure.com")
+    monkeypatch.setenv("AZURE_OPENAI_API_KEY", "test")
+    return AzureClient(chat_completion_model="test-deployment", cache=LRUTTLCache())
+
+
+def _fake_completions(client, finish_reason):
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        usage = SimpleNamespace(prompt_tokens=5, completion_tokens=2, total_tokens=7)
+        return FakeStream([_chunk(), _chunk("Hello "), _chunk("there", finish_reason), _chunk(usage=usage)])
+
+    client.async_client.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    return calls
+
+
+def _stream(client):
+    return "".join(client.stream_chat_completion([{"role": "user", "content": "hi"}], temperature=0))
+
+
+def test_completed_stream_is_cached(client):
+    calls = _fake_completions(client, "stop")
+    assert _stream(client) == "Hello there"
+    assert _stream(client) == "Hello there"
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize("finish_reason", ["length", "content_filter"])
+def test_cut_off_stream_is_not_cached(client, finish_reason):
+    calls = _fake_completions(client, finish_reason)
+    _stream(client)
+    _stream(client)
+    assert len(calls) == 2
+
+
+def test_failed_request_gives_its_tokens_back(client):
+    limiter = RateLimiter("test", tokens_per_minute=100000)
+    client.async_client.chat_limiter = limiter
+
+    async def create(**kwargs):
+        raise ValueError("bad request")
+
+    client.async_client.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    with pytest.raises(ValueError):
+        client.get_chat_completion([{"role": "user", "content": "hi"}], temperature=0)
+    assert limiter.buckets.tokens == pytest.approx(100000, abs=10)
+
+
+def test_stopping_a_stream_early_closes_it(client):
+    streams = []
+
+    async def create(**kwargs):
+        streams.append(FakeStream(_chunk(f"{number} ") for number in itertools.count()))
+        return streams[-1]
+
+    client.async_client.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    chunks = client.stream_chat_completion([{"role": "user", "content": "hi"}])
+    assert [next(chunks), next(chunks)] == ["0 ", "1 "]
+    chunks.close()
+
+    deadline = time.monotonic() + 2
+    while not streams[0].closed and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert streams[0].closed
+
+
+def test_stream_failing_before_its_usage_gives_back_the_unused_tokens(client):
+    limiter = RateLimiter("test-stream", tokens_per_minute=100000)
+    client.async_client.chat_limiter = limiter
+
+    class BrokenStream(FakeStream):
+        async def __anext__(self):
+            chunk = await super().__anext__()
+            if chunk is None:
+                raise ConnectionError("stream dropped")
+            return chunk
+
+    async def create(**kwargs):
+        return BrokenStream([_chunk("Hello "), None])
+
+    client.async_client.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    with pytest.raises(ConnectionError):
+        list(client.stream_chat_completion([{"role": "user", "content": "hi"}], max_tokens=4000))
+    # Only the prompt and the streamed "Hello " stay charged, not the 4000 reserved for the answer
+    assert limiter.buckets.tokens == pytest.approx(100000, abs=10)
@@ -0,0 +1,56 @@
+import pytest
+
+from connection.brevo import Brevo
+from connection.email_outbox import EmailOutbox
+from connection.send_digest import send_digest
+
+
+CAMPAIGN = "digest-5-2026-W42"
+
+
+@pytest.fixture
+def brevo():
+    brevo = Brevo(dry_run=True)
+    yield brevo
+    brevo.close()
+
+
+@pytest.fixture
+def outbox(brevo, tmp_path):
+    return EmailOutbox(brevo, path=str(tmp_path / "outbox.db"))
+
+
+def _sent_to(brevo):
+    return sorted(version["to"][0]["email"] for request in brevo.stub.requests for version in request["messageVersions"])
+
+
+def _send(brevo, outbox, emails):
+    return send_digest(brevo, outbox, 5, [{"email": email} for email in emails], CAMPAIGN, batch_size=2)
+
+
+def test_batch_keys_follow_the_recipients_not_the_position(brevo):
+    def keys(emails):
+        brevo.stub.requests.clear()
+        brevo.send_bulk_template_email(5, [{"email": email} for email in emails], batch_size=2, idempotency_key=CAMPAIGN)
+        return sorted(request["headers"]["idempotencyKey"] for request in brevo.stub.requests)
+
+    first_run = keys(["a@x.com", "b@x.com", "c@x.com"])
+    assert len(set(first_run)) == 2
+    assert all(key.startswith(f"{CAMPAIGN}-") for key in first_run)
+    assert keys(["B@x.com", "a@x.com", "c@x.com"]) == first_run
+
+
+def test_rerun_after_new_signups_only_sends_to_the_new_recipients(brevo, outbox):
+    results = _send(brevo, outbox, ["a@x.com", "b@x.com", "c@x.com"])
+    assert all(result.ok for result in results)
+    assert _sent_to(brevo) == ["a@x.com", "b@x.com", "c@x.com"]
+
+    brevo.stub.requests.clear()
+    results = _send(brevo, outbox, ["new@x.com", "A@x.com", "b@x.com", "c@x.com"])
+    assert [result.email for result in results] == ["new@x.com"]
+    assert _sent_to(brevo) == ["new@x.com"]
+
+
+def test_dry_run_records_nothing(brevo, outbox):
+    send_digest(brevo, outbox, 5, [{"email": "a@x.com"}], CAMPAIGN, record=False)
+    assert outbox.sent_to(CAMPAIGN, ["a@x.com"]) == set()
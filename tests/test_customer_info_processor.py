@@ -0,0 +1,45 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from customer_info_processor import CustomerInfoProcessor
+
+
+class FakeClient:
+    def __init__(self, content):
+        self.content = content
+        self.prompts = []
+
+    def get_chat_completion(self, messages, **kwargs):
+        self.prompts.append(messages[0]["content"])
+        return {"content": self.content}
+
+
+def _processor(content):
+    # Skips __init__, which builds an Azure client
+    processor = CustomerInfoProcessor.__new__(CustomerInfoProcessor)
+    processor.client = FakeClient(content)
+    return processor
+
+
+MESSAGES = [SimpleNamespace(type="human", content="I'm Sarah, looking for a 2 bed flat")]
+EXTRACTED = json.dumps({"first_name": " Sarah ", "number_of_rooms": "2", "email": None})
+
+
+@pytest.mark.parametrize("known_info", [None, {}])
+def test_without_prior_info_the_result_is_normalised(known_info):
+    info = _processor(EXTRACTED).process_conversation(MESSAGES, known_info=known_info)
+    assert info == {"first_name": "Sarah", "number_of_rooms": 2}
+
+
+def test_empty_prior_info_still_counts_as_known():
+    processor = _processor(EXTRACTED)
+    processor.process_conversation(MESSAGES, known_info={})
+    assert "Information already known" in processor.client.prompts[0]
+
+
+@pytest.mark.parametrize("content", ["not json", "[1, 2]", '"Sarah"'])
+def test_non_object_responses_raise_value_error(content):
+    with pytest.raises(ValueError, match="Failed to parse customer information"):
+        _processor(content).process_conversation(MESSAGES, known_info={"first_name": "Sarah"})
@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+from connection.firestore import FireStore
+
+
+class FakeQuery:
+    """Collection stand-in returning its documents in pages, ordered by ID."""
+
+    def __init__(self, documents, limit=None, after=None):
+        self.documents = documents
+        self._limit = limit
+        self._after = after
+
+    def order_by(self, field):
+        return self
+
+    def limit(self, count):
+        return FakeQuery(self.documents, count, self._after)
+
+    def start_after(self, snapshot):
+        return FakeQuery(self.documents, self._limit, snapshot.id)
+
+    def stream(self):
+        ids = sorted(doc_id for doc_id in self.documents if self._after is None or doc_id > self._after)
+        for doc_id in ids[:self._limit]:
+            yield SimpleNamespace(id=doc_id, to_dict=lambda doc_id=doc_id: dict(self.documents[doc_id]))
+
+
+def _store(documents):
+    # Skips __init__, which connects to Firestore
+    store = FireStore.__new__(FireStore)
+    store.users_collection = FakeQuery(documents)
+    return store
+
+
+USERS = {f"user-{i}": {"email": f"{i}@example.com"} for i in range(5)}
+
+
+def test_list_all_users_returns_the_document_fields_only(monkeypatch):
+    monkeypatch.setattr("connection.firestore.EXPORT_PAGE_SIZE", 2)
+    users = _store(USERS).list_all_users()
+    assert users == [{"email": f"{i}@example.com"} for i in range(5)]
+
+
+def test_iter_users_adds_the_document_id():
+    users = list(_store(USERS).iter_users(page_size=2))
+    assert [user["id"] for user in users] == list(USERS)
+    assert users[0] == {"id": "user-0", "email": "0@example.com"}
@@ -0,0 +1,30 @@
+import os
+
+import numpy as np
+
+from geo import load_points
+
+
+def _write_csv(path, header, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(",".join(header) + "\n")
+        for row in rows:
+            f.write(",".join(str(value) for value in row) + "\n")
+
+
+def test_rebuilt_cache_drops_removed_columns_and_keeps_mapped_files(tmp_path):
+    csv_path = tmp_path / "geo_test_points.csv"
+    _write_csv(csv_path, ["name", "lat", "lon", "rating"], [["a", 51.5, -0.1, "good"], ["b", 51.6, -0.2, "outstanding"]])
+    before = load_points("geo_test_points", data_dir=str(tmp_path))
+    assert list(before.columns) == ["name", "lat", "lon", "rating"]
+
+    _write_csv(csv_path, ["name", "lat", "lon"], [["c", 51.7, -0.3]])
+    after = load_points("geo_test_points", data_dir=str(tmp_path))
+
+    assert list(after.columns) == ["name", "lat", "lon"]
+    assert after["name"].tolist() == ["c"]
+    # The first build's arrays were not overwritten under the earlier PointSet
+    assert before["name"].tolist() == ["a", "b"]
+    np.testing.assert_allclose(before.lat, [51.5, 51.6])
+    cache_dir = tmp_path / "cache" / "geo_test_points"
+    assert sorted(os.listdir(cache_dir)) == sorted([after.version, "_version"])
@@ -0,0 +1,38 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from connection.rate_limiter import RateLimiter, RateLimitWaitError
+
+
+def test_acquire_gives_up_after_the_timeout():
+    async def run():
+        limiter = RateLimiter("timeout", requests_per_minute=1, timeout=0.1)
+        await limiter.acquire(10)
+        with pytest.raises(RateLimitWaitError):
+            await limiter.acquire(10)
+        # The starved request left the queue
+        await asyncio.sleep(0.3)
+        return limiter._waiters
+
+    assert asyncio.run(run()) == []
+
+
+def test_locked_sqlite_buckets_dont_block_the_event_loop(tmp_path):
+    path = str(tmp_path / "buckets.db")
+
+    async def run():
+        limiter = RateLimiter("sqlite", tokens_per_minute=1000, state_path=path, timeout=5)
+        blocker = sqlite3.connect(path, isolation_level=None)
+        blocker.execute("BEGIN IMMEDIATE")
+        acquire = asyncio.ensure_future(limiter.acquire(10))
+        start = time.monotonic()
+        await asyncio.sleep(0.05)
+        lag = time.monotonic() - start
+        blocker.execute("COMMIT")
+        await acquire
+        return lag
+
+    assert asyncio.run(run()) < 0.5
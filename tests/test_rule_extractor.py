@@ -0,0 +1,69 @@
+import pytest
+
+from rule_extractor import RuleBasedExtractor
+
+
+@pytest.fixture
+def extractor():
+    return RuleBasedExtractor()
+
+
+@pytest.mark.parametrize("text", ["I'm Sarah", "I am Sarah", "Hi, i'm Sarah and I'm buying"])
+def test_introductions_fill_first_name(extractor, text):
+    assert extractor.extract(text)["first_name"].value == "Sarah"
+
+
+def test_lowercase_words_are_not_names(extractor):
+    assert "first_name" not in extractor.extract("I am looking for a flat")
+
+
+@pytest.mark.parametrize("text", ["I'm not sure when we'll move", "No rush to buy", "Flexible on timing"])
+def test_unsure_about_timing(extractor, text):
+    assert extractor.extract(text)["timeline"].value == "not sure"
+
+
+@pytest.mark.parametrize("text", ["I'm not sure about the location", "flexible on price", "I don't know the area"])
+def test_unsure_about_something_else_leaves_timeline_unknown(extractor, text):
+    assert "timeline" not in extractor.extract(text)
+
+
+@pytest.mark.parametrize("text", ["I'm buying on my own", "Just me on the mortgage", "I'm a single buyer"])
+def test_buying_alone(extractor, text):
+    assert extractor.extract(text)["is_buying_alone"].value is True
+
+
+@pytest.mark.parametrize("text", ["leave me alone", "I live on my own in Hackney", "just me asking"])
+def test_alone_without_buying_context_leaves_field_unknown(extractor, text):
+    assert "is_buying_alone" not in extractor.extract(text)
+
+
+@pytest.mark.parametrize("text", ["I am British", "I am Living in London", "This is Uchi?", "my friend said I'm Sarah"])
+def test_descriptions_and_questions_are_not_introductions(extractor, text):
+    assert "first_name" not in extractor.extract(text)
+
+
+def test_introduction_after_another_sentence(extractor):
+    assert extractor.extract("We want a flat. I'm Tom")["first_name"].value == "Tom"
+
+
+@pytest.mark.parametrize("text", ["I own my house", "Im selling my flat"])
+def test_current_home_is_not_the_property_type(extractor, text):
+    assert "property_type" not in extractor.extract(text)
+
+
+def test_property_type_after_current_home(extractor):
+    assert extractor.extract("I own my house and want a 2 bed flat")["property_type"].value == "apartment"
+
+
+@pytest.mark.parametrize("text", ["I earn 60k", "£450k", "I have a 50k deposit and want to buy"])
+def test_amounts_without_budget_context_are_not_the_budget(extractor, text):
+    assert "maximum_budget" not in extractor.extract(text)
+
+
+@pytest.mark.parametrize("text, budget", [
+    ("I earn 60k and my budget is 450k", 450),
+    ("We can afford £1.2m", 1200),
+    ("up to 500,000", 500),
+])
+def test_budget(extractor, text, budget):
+    assert extractor.extract(text)["maximum_budget"].value == budget
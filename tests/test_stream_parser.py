@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from stream_parser import JsonFieldStreamer
+
+
+def _stream(raw, size):
+    parser = JsonFieldStreamer(field="response")
+    fed = "".join(parser.feed(raw[i:i + size]) for i in range(0, len(raw), size))
+    assert fed == parser.text
+    return parser
+
+
+def _split_everywhere(raw):
+    """Parsers fed the raw text in two chunks, split at every possible position."""
+    for split in range(len(raw) + 1):
+        parser = JsonFieldStreamer(field="response")
+        parser.feed(raw[:split])
+        parser.feed(raw[split:])
+        yield parser
+
+
+@pytest.mark.parametrize("value", [
+    'say "hi" to them',
+    "back\\slash and a\ttab\nnewline",
+    "café",
+    "emoji 😀 outside the BMP",
+])
+def test_escapes_split_across_chunks(value):
+    raw = json.dumps({"response": value, "extracted_info": {"first_name": "Sarah"}})
+    assert "\\" in raw
+    for parser in _split_everywhere(raw):
+        assert parser.text == value
+        assert parser.finish() == {"response": value, "extracted_info": {"first_name": "Sarah"}}
+
+
+@pytest.mark.parametrize("size", [1, 3, 7])
+def test_escapes_fed_in_small_chunks(size):
+    value = 'quote " unicode é 😀 end'
+    assert _stream(json.dumps({"response": value}), size).text == value
+
+
+def test_field_that_never_closes():
+    parser = _stream('{"response": "Hello wor', 4)
+    assert parser.text == "Hello wor"
+    assert parser.finish() is None
+
+
+def test_field_cut_off_inside_an_escape():
+    parser = _stream('{"response": "caf\\u00', 2)
+    assert parser.text == "caf"
+    assert parser.finish() is None
+
+
+def test_nested_objects_before_the_target_field():
+    raw = json.dumps({
+        "extracted_info": {"response": "not this one", "tags": ["a", {"response": "nor this"}]},
+        "wants_to_signup": False,
+        "response": "this one",
+    })
+    for parser in _split_everywhere(raw):
+        assert parser.text == "this one"
+        assert parser.finish()["response"] == "this one"
+
+
+def test_target_name_as_a_value_is_not_the_field():
+    parser = _stream(json.dumps({"kind": "response", "response": "yes"}), 5)
+    assert parser.text == "yes"
+
+
+def test_fenced_json():
+    parser = _stream('```json\n{"response": "fenced"}\n```', 4)
+    assert parser.text == "fenced"
+    assert parser.finish() == {"response": "fenced"}
+
+
+def test_plain_text_passes_through():
+    parser = _stream("  Sorry, I can only help with property searches.", 6)
+    assert parser.text == "Sorry, I can only help with property searches."
+    assert parser.finish() is None
@@ -0,0 +1,111 @@
+import time
+
+import pytest
+
+import submission_processor
+from connection.cache import LRUTTLCache
+from submission_processor import (
+    RecommendationJob,
+    RecommendationJobManager,
+    RecommendationProcessor,
+    preference_fingerprint,
+)
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.headers = {"Content-Type": "application/json"}
+        self.body = body or {}
+        self.closed = False
+
+    def json(self):
+        return self.body
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@pytest.fixture
+def processor():
+    # Skips __init__, which reads st.secrets
+    processor = RecommendationProcessor.__new__(RecommendationProcessor)
+    processor.url = "http://recommender.test/create"
+    processor.wait_window = 1
+    return processor
+
+
+@pytest.mark.parametrize("status_code, body, status", [
+    (200, {"matched_properties": [{"id": 1}]}, "done"),
+    (503, None, "failed"),
+])
+def test_response_is_closed(monkeypatch, processor, status_code, body, status):
+    response = FakeResponse(status_code, body)
+    monkeypatch.setattr(submission_processor.http_session, "post", lambda *args, **kwargs: response)
+    job = RecommendationJob("job", "submission")
+    processor._make_request(job)
+    assert job.status == status
+    assert response.closed
+
+
+def test_cache_hit_still_sends_the_submission(monkeypatch, processor):
+    posted = []
+
+    def post(url, json, **kwargs):
+        posted.append(json["submission_id"])
+        return FakeResponse(200, {"matched_properties": [{"id": 1}]})
+
+    monkeypatch.setattr(submission_processor.http_session, "post", post)
+    processor.jobs = RecommendationJobManager()
+    processor.results_cache = LRUTTLCache()
+    preferences = {"preferred_location": "West London", "number_of_rooms": 2}
+
+    first = processor.submit("first", preferences=preferences, gif_url="gif")
+    while not processor.jobs.get(first).is_finished:
+        time.sleep(0.01)
+    job_id = processor.submit("second", preferences=preferences, gif_url="gif")
+    processor.jobs.executor.shutdown(wait=True)
+
+    assert processor.jobs.get(job_id).result == [{"id": 1}]
+    assert posted == ["first", "second"]
+
+
+def test_locations_are_order_insensitive_but_free_text_is_not():
+    assert preference_fingerprint({"preferred_location": "West London,Finsbury Park"}) == \
+        preference_fingerprint({"preferred_location": "finsbury park, west london"})
+    assert preference_fingerprint({"user_preference": "quiet, not near a school"}) != \
+        preference_fingerprint({"user_preference": "not near a school, quiet"})
+
+
+class TricklingResponse(FakeResponse):
+    """NDJSON response sending a line every few milliseconds, forever."""
+
+    def __init__(self):
+        super().__init__(200)
+        self.headers = {"Content-Type": "application/x-ndjson"}
+        self.encoding = "utf-8"
+
+    def iter_lines(self, decode_unicode=False):
+        number = 0
+        while not self.closed:
+            time.sleep(0.01)
+            number += 1
+            yield '{"id": %d}' % number
+
+
+def test_trickling_stream_is_handed_off_at_the_wait_window(monkeypatch, processor):
+    response = TricklingResponse()
+    monkeypatch.setattr(submission_processor.http_session, "post", lambda *args, **kwargs: response)
+    processor.wait_window = 0.2
+    job = RecommendationJob("job", "submission")
+    processor._make_request(job)
+    assert job.status == "handed_off"
+    assert job.result
+    assert response.closed
+    assert job.elapsed < 1
@@ -0,0 +1,56 @@
+import pytest
+
+from submit_pipeline import run_submit_pipeline
+
+
+class FakeFireStore:
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    def insert_submission(self, results):
+        if self.fail:
+            raise RuntimeError("firestore down")
+        return "submission-1"
+
+
+class FakeGifService:
+    def get_working_hard_gif(self):
+        return "working.gif"
+
+
+class FakeProcessor:
+    git_service = FakeGifService()
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, submission_id, preferences=None, gif_url=None):
+        self.submitted.append((submission_id, gif_url))
+        return "job-1"
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.queued = []
+
+    def enqueue_welcome_email(self, email, first_name):
+        self.queued.append(email)
+        return True
+
+
+def test_submit_queues_email_and_starts_recommendation():
+    processor, outbox = FakeProcessor(), FakeOutbox()
+    graph = run_submit_pipeline(FakeFireStore(), processor, {"email": "a@b.com", "first_name": "A"}, email_outbox=outbox)
+
+    assert graph.results["recommendation"] == "job-1"
+    assert processor.submitted == [("submission-1", "working.gif")]
+    assert outbox.queued == ["a@b.com"]
+
+
+def test_failed_write_queues_no_email():
+    processor, outbox = FakeProcessor(), FakeOutbox()
+    with pytest.raises(RuntimeError, match="firestore down"):
+        run_submit_pipeline(FakeFireStore(fail=True), processor, {"email": "a@b.com", "first_name": "A"}, email_outbox=outbox)
+
+    assert outbox.queued == []
+    assert processor.submitted == []
@@ -1,9 +1,8 @@
-import time
 import uuid
 
 import streamlit as st
 from langchain_core.messages import AIMessage, HumanMessage
-from langchain_agents import get_response
+from langchain_agents import get_response_stream
 from urllib.parse import parse_qs, urlencode
 from langfuse import get_client, observe
 
@@ -20,14 +19,12 @@ def run_chat():
             st.markdown(
                 "Hello! I am an <b>AI assistant</b> for Uchi. I'm here to help you find your perfect home to buy! ",
                 unsafe_allow_html=True)
-        time.sleep(1)
         try:
             gif_url = st.session_state.gif_service.get_greeting_gif()
             st.image(gif_url, width=400)
         except Exception as e:
             print(str(e))
 
-        time.sleep(1)
         greeting = "I heard you are looking for a home to buy and would love to know more. First, what is your name ? 😊"
         st.session_state.messages.append({"role": "assistant", "content": greeting})
 
@@ -40,24 +37,37 @@ def run_chat():
     if prompt := st.chat_input("Hi, how can I help you today?"):
         st.session_state.messages.append({"role": "user", "content": prompt})
         with st.chat_message("user"):
-            if "@" in str(prompt) or "sign up" in str(prompt):
+            # Structured fields like email, budget and bedrooms are picked up locally on every message
+            rule_matches = st.session_state.info_processor.rules.extract(str(prompt))
+            st.session_state.customer_info = st.session_state.info_processor.apply_rule_matches(
+                st.session_state.customer_info, rule_matches
+            )
+            if "email" in rule_matches or "sign up" in str(prompt).lower():
                 st.session_state.wants_to_signup = True
             st.markdown(prompt, unsafe_allow_html=True)
 
         with st.chat_message("assistant"):
-            new_state = get_response(
+            streamed_response = get_response_stream(
                 messages=st.session_state.messages,
                 customer_info=st.session_state.customer_info,
                 wants_to_signup=st.session_state.wants_to_signup,
                 session_id=st.session_state.session_id,
+                memory_state=st.session_state.conversation_memory,
             )
+            # Render the reply token by token, the extracted fields are only known once it finishes
+            st.write_stream(streamed_response)
+            new_state = streamed_response.result
             langfuse_client.flush()
             response = new_state["response"]
             st.session_state.messages.append({"role": "assistant", "content": response})
-            st.session_state.customer_info = new_state["customer_info"]
+            st.session_state.customer_info = st.session_state.info_processor.merge_extracted_info(
+                st.session_state.customer_info, new_state["customer_info"]
+            )
+            if new_state.get("info_extracted"):
+                # The agent has read every turn up to here, the extractor only needs what comes after
+                st.session_state.extracted_upto = len(st.session_state.messages)
             if not st.session_state.wants_to_signup:
                 st.session_state.wants_to_signup = new_state.get("wants_to_signup", False)
-            st.markdown(response, unsafe_allow_html=True)
 
         # If user wants to sign up, process the conversation and show signup button
         if st.session_state.wants_to_signup:
@@ -71,17 +81,24 @@ def run_chat():
                     except Exception as e:
                         print(f"Error displaying GIF: {str(e)}")
 
-                # Convert messages to BaseMessage format
-                base_messages = []
-                for msg in st.session_state.messages:
-                    if msg["role"] == "user":
-                        base_messages.append(HumanMessage(content=msg["content"]))
-                    else:
-                        base_messages.append(AIMessage(content=msg["content"]))
-
                 # Process the conversation
                 try:
-                    customer_info = st.session_state.info_processor.process_conversation(base_messages)
+                    customer_info = st.session_state.customer_info
+                    info_processor = st.session_state.info_processor
+                    new_messages = st.session_state.messages[st.session_state.extracted_upto:]
+                    customer_info = info_processor.extract_with_rules(customer_info, new_messages)
+                    # Only go back to the LLM for turns the agent has not extracted from yet, and
+                    # only if the rules could not fill in everything (e.g. free-text motivation)
+                    if new_messages and not info_processor.is_complete(customer_info):
+                        # Convert messages to BaseMessage format
+                        base_messages = []
+                        for msg in new_messages:
+                            if msg["role"] == "user":
+                                base_messages.append(HumanMessage(content=msg["content"]))
+                            else:
+                                base_messages.append(AIMessage(content=msg["content"]))
+                        customer_info = info_processor.process_conversation(base_messages, known_info=customer_info)
+                        st.session_state.extracted_upto = len(st.session_state.messages)
                     st.session_state.customer_info = customer_info
 
                     # Generate URL parameters for the survey
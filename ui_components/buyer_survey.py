@@ -1,8 +1,8 @@
 import streamlit as st
 import streamlit_survey as ss
 
-from connection.brevo import Brevo
-from connection.firestore import FireStore
+from resources import get_email_outbox, get_firestore, get_recommendation_processor
+from submit_pipeline import run_submit_pipeline
 from utils import is_strong_password
 
 
@@ -38,21 +38,21 @@ def run_buyer_survey():
     pages = survey.pages(3, progress_bar=True, on_submit=lambda: on_submit())
 
     def on_submit():
-        # Save to Firestore
-        firestore = FireStore(credential_info=st.secrets["firestore_credentials"])
         submission_data = st.session_state.form_results.copy()
         submission_data["listing_type"] = "buy"
         submission_data["session_id"] = get_param("chat_session_id")
-        submission_id = firestore.insert_submission(submission_data)
+        # Saves to Firestore, starts the recommendation search and queues the welcome email,
+        # overlapping whatever doesn't depend on the submission ID
+        pipeline = run_submit_pipeline(
+            get_firestore(),
+            get_recommendation_processor("sale"),
+            submission_data,
+            email_outbox=get_email_outbox(),
+        )
 
         # Show immediate feedback
         st.success("Submitted!")
-        st.session_state.recommendation_processor.submit_and_wait(submission_id)
-
-        brevo = Brevo()  # or rely on BREVO_WELCOME_TEMPLATE_ID
-        email = st.session_state.form_results.get("email")
-        first_name = st.session_state.form_results.get("first_name")
-        brevo.send_welcome_email(email, first_name)
+        st.session_state.recommendation_job_id = pipeline.results["recommendation"]
 
     # Helper function to get customer info value with default
     def get_param(key, default=None):
@@ -212,3 +212,6 @@ def run_buyer_survey():
                 "first_name": first_name,
                 "password": password if not password_error else None
             })
+
+    if st.session_state.get("recommendation_job_id"):
+        get_recommendation_processor("sale").render_job(st.session_state.recommendation_job_id)
@@ -1,9 +1,13 @@
+import asyncio
 import functools
 import json
+import random
 import re
+import threading
 import time
 from datetime import datetime, date, timezone
-from typing import Optional, Union
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional, Union
 
 
 def save_json(data, filename):
@@ -68,3 +72,280 @@ def retry(ExceptionToCheck, tries=3, delay=1, backoff=2, logger=None):
             return f(*args, **kwargs)
         return f_retry
     return deco_retry
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the endpoint while its circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Per-endpoint circuit breaker.
+
+    After `failure_threshold` consecutive retryable failures the circuit opens and calls fail
+    fast with CircuitOpenError. Once `reset_timeout` seconds have passed a single trial call is
+    let through (half-open): success closes the circuit, failure opens it again.
+    """
+    _registry: Dict[str, "CircuitBreaker"] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_endpoint(cls, name: str, **kwargs) -> "CircuitBreaker":
+        """Return the process-wide breaker for an endpoint, creating it on first use."""
+        with cls._registry_lock:
+            if name not in cls._registry:
+                cls._registry[name] = cls(name, **kwargs)
+            return cls._registry[name]
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half-open" and self._trial_in_flight):
+                raise CircuitOpenError(f"Circuit for {self.name} is open, failing fast")
+            if state == "half-open":
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class RetryMetrics:
+    """Thread-safe counters of attempts and time spent waiting between retries."""
+
+    def __init__(self):
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.failures = 0
+        self.fast_failures = 0
+        self.retry_wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "attempts": self.attempts,
+                "retries": self.retries,
+                "failures": self.failures,
+                "fast_failures": self.fast_failures,
+                "retry_wait_seconds": round(self.retry_wait_seconds, 3),
+            }
+
+
+_retry_metrics: Dict[str, RetryMetrics] = {}
+_retry_metrics_lock = threading.Lock()
+
+
+def get_retry_metrics(name: str) -> RetryMetrics:
+    """Return the process-wide retry metrics for a named policy."""
+    with _retry_metrics_lock:
+        if name not in _retry_metrics:
+            _retry_metrics[name] = RetryMetrics()
+        return _retry_metrics[name]
+
+
+def _status_code(e: Exception) -> Optional[int]:
+    status = getattr(e, "status_code", None)
+    if status is None and getattr(e, "response", None) is not None:
+        status = getattr(e.response, "status_code", None)
+    if status is None:
+        # brevo_python ApiException
+        status = getattr(e, "status", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable_error(e: Exception) -> bool:
+    """Retry on rate limits (429), server errors (5xx), timeouts and dropped connections only."""
+    if isinstance(e, CircuitOpenError):
+        return False
+    status = _status_code(e)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(e, (TimeoutError, ConnectionError)):
+        return True
+    # openai.APITimeoutError / APIConnectionError, httpx.TimeoutException / ConnectError, ...
+    name = type(e).__name__
+    return "Timeout" in name or "Connection" in name or "Connect" in name
+
+
+def retry_after_seconds(e: Exception) -> Optional[float]:
+    """Read the server's Retry-After hint (seconds or HTTP date) from an HTTP error, if any."""
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None) or getattr(e, "headers", None)
+    if not headers:
+        return None
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+
+class RetryPolicy:
+    """
+    Retry policy with full-jitter exponential backoff, an overall deadline and an optional circuit breaker.
+
+    Only errors accepted by `classifier` are retried (by default 429/5xx/timeouts), honouring the
+    server's Retry-After. If the next wait would overrun `deadline` seconds since the first
+    attempt, the last error is raised instead of sleeping. Use as a decorator on sync or async
+    functions, or call `call`/`acall` directly; async functions wait with asyncio.sleep so the
+    event loop is never blocked.
+
+    Args:
+        name: key for the shared RetryMetrics of this policy
+        tries: maximum number of attempts (not retries)
+        base_delay: backoff base in seconds, attempt n waits uniform(0, base_delay * 2**n)
+        max_delay: cap on a single wait in seconds
+        deadline: overall time budget in seconds for all attempts and waits, None for no limit
+        classifier: returns True if an exception is worth retrying
+        breaker: circuit breaker guarding the endpoint
+    """
+
+    def __init__(
+        self,
+        name: str = "default",
+        tries: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 8,
+        deadline: Optional[float] = 20,
+        classifier: Callable[[Exception], bool] = is_retryable_error,
+        breaker: Optional[CircuitBreaker] = None,
+        logger=None,
+    ):
+        self.name = name
+        self.tries = tries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.classifier = classifier
+        self.breaker = breaker
+        self.logger = logger
+        self.metrics = get_retry_metrics(name)
+
+    def __call__(self, f):
+        if asyncio.iscoroutinefunction(f):
+            @functools.wraps(f)
+            async def async_wrapper(*args, **kwargs):
+                return await self.acall(f, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            return self.call(f, *args, **kwargs)
+        return wrapper
+
+    def call(self, f, *args, **kwargs):
+        start = time.monotonic()
+        self.metrics.add(calls=1)
+        for attempt in range(self.tries):
+            self._before_attempt()
+            try:
+                result = f(*args, **kwargs)
+            except Exception as e:
+                wait = self._on_failure(e, attempt, start)
+                time.sleep(wait)
+                continue
+            self._on_success()
+            return result
+
+    async def acall(self, f, *args, **kwargs):
+        start = time.monotonic()
+        self.metrics.add(calls=1)
+        for attempt in range(self.tries):
+            self._before_attempt()
+            try:
+                result = await f(*args, **kwargs)
+            except Exception as e:
+                wait = self._on_failure(e, attempt, start)
+                await asyncio.sleep(wait)
+                continue
+            self._on_success()
+            return result
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: a uniform wait between 0 and the capped exponential delay."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _before_attempt(self):
+        if self.breaker:
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                self.metrics.add(fast_failures=1, failures=1)
+                raise
+        self.metrics.add(attempts=1)
+
+    def _on_success(self):
+        if self.breaker:
+            self.breaker.record_success()
+
+    def _on_failure(self, e: Exception, attempt: int, start: float) -> float:
+        """Return how long to wait before the next attempt, or re-raise if we should give up."""
+        retryable = self.classifier(e)
+        if self.breaker:
+            if retryable:
+                self.breaker.record_failure()
+            else:
+                # The endpoint answered, e.g. a 400, so it is healthy
+                self.breaker.record_success()
+
+        wait = self.backoff(attempt)
+        retry_after = retry_after_seconds(e)
+        if retry_after is not None:
+            wait = retry_after
+        elapsed = time.monotonic() - start
+        out_of_time = self.deadline is not None and elapsed + wait > self.deadline
+        if not retryable or attempt == self.tries - 1 or out_of_time:
+            self.metrics.add(failures=1)
+            raise e
+
+        msg = f"{e}, Retrying in {wait:.2f} seconds... ({self.tries - attempt - 1} tries left)"
+        if self.logger:
+            self.logger.warning(msg)
+        else:
+            print(msg)
+        self.metrics.add(retries=1, retry_wait_seconds=wait)
+        return wait